@@ -1,17 +1,20 @@
 import atexit
 import bisect
-import collections
-import gzip
 import os
 import re
 import subprocess
 import tempfile
 import utils
+import cnfinstance
+import strategies
 from pyminisolvers import minisolvers
 
 
 class MinisatSubsetSolver(object):
-    def __init__(self, infile, rand_seed=None, store_dimacs=False):
+    shrink_strategy = 'deletion'
+    grow_strategy = 'linear'
+
+    def __init__(self, infile, rand_seed=None, store_dimacs=False, rotate=False):
         self.s = minisolvers.MinisatSubsetSolver()
 
         # Initialize random seed and randomize variable activity if seed is given
@@ -20,95 +23,73 @@ class MinisatSubsetSolver(object):
             self.s.set_rnd_init_act(True)
 
         self.store_dimacs = store_dimacs
-        if self.store_dimacs:
-            self.dimacs = []
-            self.groups = collections.defaultdict(list)
+        self.rotate = rotate  # use model rotation in shrink()
+        self.instance = None  # kept (when store_dimacs or rotate) for solvers that need the clauses themselves
+        self._occurs = None   # clauses containing each literal, for model rotation
         self.read_dimacs(infile)
         self._msolver = None
+        self.stats = utils.Statistics()  # replaced by set_stats() to report out
+        self.cache = None     # optional LatticeCache of known SAT / UNSAT subsets
+        self.cached = False   # whether the last check_subset() was answered from the cache
 
     def set_msolver(self, msolver):
         self._msolver = msolver
 
-    def parse_dimacs(self, f):
-        i = 0
-        for line in f:
-            if line.startswith(b'p'):
-                tokens = line.split()
-                gcnf_in = (tokens[1] == b"gcnf")
-                self.nvars = int(tokens[2])
-                self.nclauses = int(tokens[3])
-
-                # self.n = number of soft constraints
-                if gcnf_in:
-                    self.n = int(tokens[4])
-                else:
-                    self.n = self.nclauses
-
-                self.s.set_varcounts(self.nvars, self.n)
-
-                while self.s.nvars() < self.nvars:
-                    # let instance variables do whatever...
-                    self.s.new_var()
-                while self.s.nvars() < self.nvars + self.n:
-                    # but default relaxation variables to try to *enable*
-                    # clauses (to find larger sat subsets and/or hit unsat
-                    # sooner)
-                    self.s.new_var(True)
-                continue
+    def set_stats(self, stats):
+        self.stats = stats
 
-            if line.startswith(b'c'):
-                continue
+    def set_strategies(self, shrink, grow):
+        self.shrink_strategy = shrink
+        self.grow_strategy = grow
 
-            line = line.strip()
-            if line == b'':
-                continue
+    def set_cache(self, cache):
+        self.cache = cache
 
-            # anything else is a clause
-            assert self.n > 0
-            vals = line.split()
-            assert vals[-1] == b'0'
+    def increment_counter(self, category, amount=1):
+        self.stats.increment_counter(category, amount)
 
-            if gcnf_in:
-                groupid = int(vals[0][1:-1])  # "parse" the '{x}' group ID
-                assert 0 <= groupid <= self.n
-                clause = [int(x) for x in vals[1:-1]]
-            else:
-                groupid = i+1
-                clause = [int(x) for x in vals[:-1]]
+    def read_dimacs(self, infile):
+        # infile may be an open file or an already-loaded CNFInstance
+        if isinstance(infile, cnfinstance.CNFInstance):
+            inst = infile
+        else:
+            inst = cnfinstance.load(infile)
+        self.load_instance(inst)
 
-            if groupid == 0:
-                # add as a hard clause
-                self.s.add_clause(clause)
-            else:
-                self.s.add_clause_instrumented(clause, groupid-1)
+    def load_instance(self, inst):
+        self.nvars = inst.nvars
+        self.nclauses = inst.nclauses
+        self.n = inst.n  # number of soft constraints
 
-            if self.store_dimacs:
-                if gcnf_in:
-                    # need to reform clause without '{x}' group index
-                    self.dimacs.append(b" ".join(str(x).encode() for x in clause) + b" 0\n")
-                    self.groups[groupid].append(i)
-                else:
-                    self.dimacs.append(line + b"\n")
-                    self.groups[groupid] = [i]
+        self.s.set_varcounts(self.nvars, self.n)
 
-            i += 1
+        while self.s.nvars() < self.nvars:
+            # let instance variables do whatever...
+            self.s.new_var()
+        while self.s.nvars() < self.nvars + self.n:
+            # but default relaxation variables to try to *enable*
+            # clauses (to find larger sat subsets and/or hit unsat
+            # sooner)
+            self.s.new_var(True)
 
-        assert i == self.nclauses
+        # Add every clause in a single call (much faster than crossing into
+        # the library per clause): group 0 clauses are added as hard
+        # clauses, all others instrumented.
+        self.s.add_clauses_grouped(inst.lits, inst.groups)
 
-    def read_dimacs(self, infile):
-        if infile.name.endswith('.gz'):
-            # use gzip to decompress
-            infile.close()
-            with gzip.open(infile.name, 'rb') as gz_f:
-                self.parse_dimacs(gz_f)
-        else:
-            # XXX TODO: using open() here to avoid dupe infile object for parallel branch,
-            #           but this breaks reading from stdin.
-            # assume plain .cnf and pass through the file object
-            with open(infile.name, 'rb') as f:
-                self.parse_dimacs(f)
+        if self.store_dimacs or self.rotate:
+            self.instance = inst
 
     def check_subset(self, seed, improve_seed=False):
+        if self.cache is not None:
+            is_sat, improved, self.cached = self.cache.check(seed, self.solve_improved)
+            self.increment_counter('cache.lookups')
+            if self.cached:
+                self.increment_counter('cache.hits')
+            if improve_seed:
+                return is_sat, improved
+            return is_sat
+
         is_sat = self.s.solve_subset([i-1 for i in seed])
         if improve_seed:
             if is_sat:
@@ -119,24 +100,121 @@ class MinisatSubsetSolver(object):
         else:
             return is_sat
 
+    def solve_improved(self, seed):
+        # check seed in the solver, returning the satisfied subset or unsat core
+        if self.s.solve_subset([i-1 for i in seed]):
+            return True, self.s.sat_subset(offset=1)
+        else:
+            return False, self.s.unsat_core(offset=1)
+
     def complement(self, aset):
-        return set(range(1, self.n+1)).difference(aset)
+        return utils.BitSet(self.n, aset).complement()
 
     def shrink(self, seed):
-        hard = self._msolver.implies()
+        hard = set(self._msolver.implies())
+        if self.shrink_strategy == 'qx':
+            with self.stats.time('shrink.qx'):
+                return strategies.shrink_qx(self, seed, hard)
+
         current = set(seed)
+        critical = hard.intersection(current)
         for i in seed:
-            if i not in current or i in hard:
+            if i not in current or i in critical:
                 # May have been "also-removed"
                 continue
             current.remove(i)
-            if not self.check_subset(current):
+            self.increment_counter('shrink.sat_calls')
+            is_sat, improved = self.check_subset(current, improve_seed=True)
+            if not is_sat:
                 # Remove any also-removed constraints
-                current = set(self.s.unsat_core(offset=1))  # helps a bit
+                current = set(improved)  # helps a bit
             else:
                 current.add(i)
+                if self.rotate and not self.cached:  # (needs the model)
+                    critical.add(i)
+                    self.increment_counter('shrink.rotated', self.rotate_model(i, current, critical))
         return current
 
+    def rotate_model(self, c, current, critical):
+        """Recursive model rotation: find more constraints that are critical
+        in current (an unsatisfiable set), starting from the solver's model,
+        which satisfies every constraint in current except c.  Flipping one
+        variable of a falsified clause of c gives a model that, if it
+        falsifies exactly one other constraint of current (and no hard
+        clause), shows that constraint is critical as well, and is rotated
+        in turn.
+
+        Adds the constraints found to critical, and returns how many there were.
+        """
+        inst = self.instance
+        lits = inst.lits
+        offsets = inst.offsets
+        groups = inst.groups
+        if self._occurs is None:
+            self._occurs = self.build_occurs()
+        occurs = self._occurs
+        nv = self.nvars
+        val = self.s.get_model(0, nv)
+
+        def falsified(j):
+            for k in range(offsets[j], offsets[j+1]-1):
+                lit = lits[k]
+                if val[abs(lit)-1] == (lit > 0):
+                    return False
+            return True
+
+        def candidates(g):
+            # variables that could be flipped to satisfy constraint g
+            ret = set()
+            for j in inst.group_clauses(g):
+                if falsified(j):
+                    ret.update(abs(lits[k])-1 for k in range(offsets[j], offsets[j+1]-1))
+            return iter(sorted(ret))
+
+        found = 0
+        stack = [(c, candidates(c), None)]
+        while stack:
+            g, flips, flipped = stack[-1]
+            for v in flips:
+                # only clauses with the literal that becomes false can become falsified
+                nowfalse = v+1 if val[v] else -(v+1)
+                val[v] = not val[v]
+                hit = None
+                for j in occurs[nowfalse + nv]:
+                    h = groups[j]
+                    if h != 0 and h not in current:
+                        continue
+                    if falsified(j):
+                        if h == 0 or (hit is not None and hit != h):
+                            hit = None
+                            break
+                        hit = h
+                if hit is not None and hit != g and hit not in critical and \
+                        not any(falsified(j) for j in inst.group_clauses(g)):
+                    # the new model is a witness for hit
+                    critical.add(hit)
+                    found += 1
+                    stack.append((hit, candidates(hit), v))
+                    break
+                val[v] = not val[v]
+            else:
+                stack.pop()
+                if flipped is not None:
+                    val[flipped] = not val[flipped]
+        return found
+
+    def build_occurs(self):
+        # clauses containing each literal l, indexed by l + nvars
+        inst = self.instance
+        lits = inst.lits
+        offsets = inst.offsets
+        nv = self.nvars
+        occurs = [[] for _ in range(2*nv + 1)]
+        for j in range(inst.nclauses):
+            for k in range(offsets[j], offsets[j+1]-1):
+                occurs[lits[k] + nv].append(j)
+        return occurs
+
     def to_c_lits(self, seed):
         # this is slow...
         nv = self.nvars+1
@@ -144,13 +222,16 @@ class MinisatSubsetSolver(object):
 
     def check_above(self, seed):
         comp = self.complement(seed)
-        x = self.s.new_var() + 1
-        self.s.add_clause([-x] + self.to_c_lits(comp))  # add a temporary clause
+        x = self.s.add_temp_clause(self.to_c_lits(comp))
         ret = self.s.solve([x] + self.to_c_lits(seed))  # activate the temporary clause and all seed clauses
-        self.s.add_clause([-x])  # remove the temporary clause
+        self.s.remove_temp_clause(x)
         return ret
 
     def grow(self, seed):
+        if self.grow_strategy == 'progression':
+            with self.stats.time('grow.progression'):
+                return strategies.grow_progression(self, seed, self.complement(seed))
+
         current = seed
 
         #while self.check_above(current):
@@ -166,15 +247,35 @@ class MinisatSubsetSolver(object):
                 continue
 
             current.append(x)
-            if self.check_subset(current):
+            is_sat, improved = self.check_subset(current, improve_seed=True)
+            if is_sat:
                 # Add any also-satisfied constraint
-                current = self.s.sat_subset(offset=1)
+                current = improved
             else:
                 current.pop()
 
         return current
 
 
+class NativeShrinkSubsetSolver(MinisatSubsetSolver):
+    """Extracts MUSes entirely within the pyminisolvers library: deletion
+    with clause-set refinement and recursive model rotation, in one call
+    per MUS (no external MUSer2 binary needed)."""
+    def shrink(self, seed, hard=None):
+        if hard is None:
+            hard = [x for x in self._msolver.implies() if x > 0]
+            # As in MUSerSubsetSolver: in parallel mode, the seed may have
+            # been explored by now, in which case the hard constraints may
+            # lie outside of it.  If so, give up on this seed.
+            if not self._msolver.check_seed(seed):
+                return None
+        ret = self.s.shrink(seed, hard, offset=1)
+        sat_calls, rotated = self.s.shrink_stats
+        self.increment_counter('shrink.sat_calls', sat_calls)
+        self.increment_counter('shrink.rotated', rotated)
+        return ret
+
+
 class MUSerSubsetSolver(MinisatSubsetSolver):
     def __init__(self, filename, rand_seed=None, numthreads=1):
         MinisatSubsetSolver.__init__(self, filename, rand_seed, store_dimacs=True)
@@ -200,28 +301,31 @@ class MUSerSubsetSolver(MinisatSubsetSolver):
         header = "p gcnf %d %d %d\n" % (self.nvars, len(seed), len(seed))
         cnffile.write(header.encode())
 
-        # Note: not writing newlines because dimacs[j] already contains a newline
-
         # existing "Don't care" group
-        for j in self.groups[0]:
-            cnffile.write(b"{0} ")  # {0} = "Don't care" group
-            cnffile.write(self.dimacs[j])
+        self.write_group(cnffile, 0, b"{0} ")  # {0} = "Don't care" group
         # also include hard clauses in "Don't care" group
         for i in hard:
-            for j in self.groups[i]:
-                cnffile.write(b"{0} ")
-                cnffile.write(self.dimacs[j])
+            self.write_group(cnffile, i, b"{0} ")
 
+        hard = set(hard)
         for g, i in enumerate(seed):
             if i in hard:
                 # skip hard clauses
                 continue
-            for j in self.groups[i]:
-                cnffile.write(("{%d} " % (g+1)).encode())
-                cnffile.write(self.dimacs[j])
+            self.write_group(cnffile, i, ("{%d} " % (g+1)).encode())
 
         cnffile.flush()
 
+    # write all clauses of one group, read directly from the instance's clause arena
+    def write_group(self, cnffile, groupid, prefix):
+        inst = self.instance
+        lits = inst.lits
+        offsets = inst.offsets
+        for j in inst.group_clauses(groupid):
+            cnffile.write(prefix)
+            cnffile.write(" ".join(map(str, lits[offsets[j]:offsets[j+1]])).encode())  # includes the terminating 0
+            cnffile.write(b"\n")
+
     # override shrink method to use MUSer2
     # NOTE: seed must be indexed (i.e., not a set)
     def shrink(self, seed):
@@ -268,8 +372,8 @@ class MUSerSubsetSolver(MinisatSubsetSolver):
 
 
 class ImprovedImpliesSubsetSolver(MinisatSubsetSolver):
-    def __init__(self, infile, rand_seed=None, store_dimacs=False):
-        MinisatSubsetSolver.__init__(self, infile, rand_seed, store_dimacs)
+    def __init__(self, infile, rand_seed=None, store_dimacs=False, rotate=False):
+        MinisatSubsetSolver.__init__(self, infile, rand_seed, store_dimacs, rotate)
         self._known_MSS = 0
         self._known_MUS = 0
 
@@ -287,16 +391,25 @@ class ImprovedImpliesSubsetSolver(MinisatSubsetSolver):
             hard = set(x for x in implications if x > 0)
         else:
             hard = set()
+        if self.shrink_strategy == 'qx':
+            with self.stats.time('shrink.qx'):
+                return strategies.shrink_qx(self, seed, hard)
+        critical = set()
 
         for i in seed:
-            if i not in current or i in hard:
+            if i not in current or i in hard or i in critical:
                 continue
             current.remove(i)
 
-            if self.check_subset(current):
+            self.increment_counter('shrink.sat_calls')
+            is_sat, improved = self.check_subset(current, improve_seed=True)
+            if is_sat:
                 current.add(i)
+                if self.rotate and not self.cached:
+                    critical.add(i)
+                    self.increment_counter('shrink.rotated', self.rotate_model(i, current, critical))
             else:
-                current = set(self.s.unsat_core(offset=1))
+                current = set(improved)
                 if self._known_MSS > 0:
                     implications = self._msolver.implies(-x for x in self.complement(current))
                     hard = set(x for x in implications if x > 0)
@@ -311,18 +424,71 @@ class ImprovedImpliesSubsetSolver(MinisatSubsetSolver):
             dont_add = set(x for x in implications if x < 0)
         else:
             dont_add = set()
+        if self.grow_strategy == 'progression':
+            with self.stats.time('grow.progression'):
+                return strategies.grow_progression(self, seed, self.complement(current).difference(-x for x in dont_add))
 
         for i in self.complement(current):
             if i in current or i in dont_add:
                 continue
             current.add(i)
 
-            if not self.check_subset(current):
+            is_sat, improved = self.check_subset(current, improve_seed=True)
+            if not is_sat:
                 current.remove(i)
             else:
-                current = set(self.s.sat_subset(offset=1))
+                current = set(improved)
                 if self._known_MUS > 0:
                     implications = self._msolver.implies(current)
                     dont_add = set(x for x in implications if x < 0)
 
         return current
+
+
+def autark_constraints(inst):
+    """Find the soft constraints of an instance outside its lean kernel:
+    those whose clauses are all satisfied by its largest autarky (a partial
+    assignment satisfying every clause it touches).  They are in every MSS
+    and no MUS.
+
+    Autarkies are found with the encoding of Liffiton and Sakallah (2008):
+    every variable v becomes two, "v is assigned true" and "v is assigned
+    false" (at most one holding), and every clause gets a selector that
+    must hold if the clause is touched and implies that it is satisfied.
+    Each solve finds an autarky satisfying some clause that no earlier one
+    did, and the union of all of them is the largest autarky.
+
+    Returns:
+        The constraints, as a sorted list.
+    """
+    s = minisolvers.MinisatSolver()
+    nv = inst.nvars
+    for _ in range(2*nv):
+        s.new_var(False)   # prefer to leave variables unassigned
+    for v in range(1, nv+1):
+        s.add_clause([-v, -(nv+v)])
+
+    selectors = []
+    for c in range(inst.nclauses):
+        sel = s.new_var(True) + 1
+        selectors.append(sel)
+        clause = [-sel]
+        for lit in inst.clause(c)[:-1]:
+            assigned = lit if lit > 0 else nv - lit   # the literal is true
+            clause.append(assigned)
+            s.add_clause([-assigned, sel])
+            s.add_clause([-(nv + lit if lit > 0 else -lit), sel])
+        s.add_clause(clause)
+
+    satisfied = bytearray(inst.nclauses)
+    while True:
+        act = s.add_temp_clause([sel for c, sel in enumerate(selectors) if not satisfied[c]])
+        if not s.solve([act]):
+            break
+        model = s.get_model()
+        for c, sel in enumerate(selectors):
+            if model[sel-1]:
+                satisfied[c] = 1
+        s.remove_temp_clause(act)
+
+    return [g for g in range(1, inst.n+1) if all(satisfied[c] for c in inst.group_clauses(g))]
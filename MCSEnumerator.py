@@ -6,24 +6,25 @@ try:
 except ImportError:
     import Queue as queue
 
+import utils
 from pyminisolvers import minisolvers
 
 
 class MCSEnumerator(object):
     def __init__(self, csolver, stats, config, pipe=None):
         self.solver = csolver.s
-        self.clauses = []
         self.blk_downs = []
         self.blk_ups = []
-        self.setup_clauses(csolver.dimacs)
+        self.instance = csolver.instance  # clause arena shared with csolver (requires store_dimacs)
         self.nvars = csolver.nvars
         self.nclauses = csolver.nclauses
         self.n = csolver.n
-        self.groups = csolver.groups
         self.instrumented_solver = None
         self.stats = stats
         self.config = config
 
+        self.feed = None  # optional source of results from other enumerators (see set_feed())
+
         self.pipe = pipe
         # if a pipe is provided, use it to receive results from other enumerators
         if self.pipe:
@@ -44,7 +45,15 @@ class MCSEnumerator(object):
 
                 self.incoming_queue.put(res)
 
+    def set_feed(self, feed):
+        # feed: a function returning a list of results found elsewhere,
+        # called whenever received results are added (as MapSolver.set_feed())
+        self.feed = feed
+
     def add_received(self, add_to_instrumented=False):
+        if self.feed is not None:
+            for res in self.feed():
+                self.incoming_queue.put(res)
         while not self.incoming_queue.empty():
             rec = self.incoming_queue.get()
             if rec[0] == 'S':
@@ -65,35 +74,21 @@ class MCSEnumerator(object):
 
         return solver.solve(assumps)
 
-    def setup_clauses(self, dimacs):
-        for clause in dimacs:
-            self.clauses.append(array.array('i', [int(i) for i in clause.split()[:-1]]))
-
     def complement(self, aset):
-        return set(range(1, self.n+1)).difference(aset)
+        return utils.BitSet(self.n, aset).complement()
 
     def setup_solver(self):
         solver = minisolvers.MinicardSubsetSolver()
         solver.set_varcounts(self.nvars, self.n)
 
         assert (self.n <= self.nclauses)
-        gcnf_in = (self.n != self.nclauses)  # In gcnf, # of groups is less than # of clauses
 
         # Create new vars
         while solver.nvars() < self.nvars + self.n:
                 solver.new_var()
 
-        # add clauses ...
-        if gcnf_in:
-            for groupid, clauses in self.groups.iteritems():
-                for j in clauses:
-                    if groupid == 0:
-                        solver.add_clause(self.clauses[j])
-                    else:
-                        solver.add_clause_instrumented(self.clauses[j], groupid-1)
-        else:
-            for i, clause in enumerate(self.clauses):
-                solver.add_clause_instrumented(clause, i)
+        # add clauses straight from the arena (group 0 hard, all others instrumented)
+        solver.add_clauses_grouped(self.instance.lits, self.instance.groups)
         for clause in self.blk_downs:
             self.block_down(solver, clause)
         for clause in self.blk_ups:
@@ -128,7 +123,7 @@ class MCSEnumerator(object):
                 res = ("S", MSS)
                 yield res
 
-                MCS = self.complement(MSS)
+                MCS = self.complement(MSS).to_array()  # (compact: one int per constraint in the MCS)
                 self.blk_downs.append(MCS)  # save for later solvers
                 self.block_down(self.solver, MCS)
                 self.block_down(self.instrumented_solver, MCS)
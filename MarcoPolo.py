@@ -7,6 +7,29 @@ except ImportError:
     import Queue as queue
 
 
+def find_critical(csolver):
+    '''Find the constraints in every MUS: those whose removal leaves the
+    complete set satisfiable (i.e., the singleton MCSes).  They are all
+    in any unsat core, so only the constraints of one core are tested,
+    and each further core found narrows the candidates.'''
+    everything = list(range(1, csolver.n + 1))
+    is_sat, core = csolver.check_subset(everything, improve_seed=True)
+    if is_sat:
+        return []
+
+    candidates = set(core)
+    critical = []
+    for c in sorted(candidates):
+        if c not in candidates:
+            continue
+        is_sat, core = csolver.check_subset([x for x in everything if x != c], improve_seed=True)
+        if is_sat:
+            critical.append(c)
+        else:
+            candidates.intersection_update(core)
+    return critical
+
+
 class MarcoPolo(object):
     def __init__(self, csolver, msolver, stats, config, pipe=None):
         self.subs = csolver
@@ -14,7 +37,6 @@ class MarcoPolo(object):
         self.seeds = SeedManager(msolver, stats, config)
         self.stats = stats
         self.config = config
-        self.bias_high = self.config['bias'] == 'MUSes'  # used frequently
         self.n = self.map.n   # number of constraints
         self.got_top = False  # track whether we've explored the complete set (top of the lattice)
 
@@ -24,6 +46,11 @@ class MarcoPolo(object):
             self.recv_thread = threading.Thread(target=self.receive_thread)
             self.recv_thread.start()
 
+    @property
+    def bias_high(self):
+        # (the bias may be changed by the master, see SeedManager.request_bias())
+        return self.config['bias'] == 'MUSes'
+
     def receive_thread(self):
         while self.pipe.poll(None):
             with self.stats.time('receive'):
@@ -31,20 +58,18 @@ class MarcoPolo(object):
                 if res == 'terminate':
                     # exit process on terminate message
                     os._exit(0)
-                # Otherwise, we've received another result,
-                # update blocking clauses.
-                # Requires map solver to be thread-safe:
-                assert hasattr(self.map, "__synchronized__") and self.map.__synchronized__
-
+                if res[0] == 'bias':
+                    # switch to another bias (--adaptive)
+                    self.seeds.request_bias(res[1])
+                    continue
+                # Otherwise, we've received another result.  Queue it to
+                # be blocked by the enumerating thread (receive() does not
+                # wait for the map solver's lock).
                 if self.config['comms_ignore']:
                     continue
 
-                if res[0] == 'S':
-                    self.map.block_down(res[1])
-                elif res[0] == 'U':
-                    self.map.block_up(res[1])
-                else:
-                    assert False
+                assert res[0] in ('S', 'U')
+                self.map.receive(res)
 
     def record_delta(self, name, oldlen, newlen, up):
         if up:
@@ -54,9 +79,53 @@ class MarcoPolo(object):
             assert newlen <= oldlen
             self.stats.add_stat("delta.%s.down" % name, float(oldlen - newlen) / self.n)
 
+    def replay(self, results):
+        '''Block results found earlier (e.g., read from a checkpoint) as if
+        they had just been enumerated, without reporting them again.'''
+        for kind, subset in results:
+            if kind == 'S':
+                try:
+                    self.subs.increment_MSS()
+                except AttributeError:
+                    pass
+                self.map.block_down(subset)
+            else:
+                self.got_top = True
+                try:
+                    self.subs.increment_MUS()
+                except AttributeError:
+                    pass
+                self.map.block_up(subset)
+
     def enumerate(self):
         '''MUS/MCS enumeration with all the bells and whistles...'''
 
+        if self.config['prepass']:
+            with self.stats.time('prepass'):
+                critical = find_critical(self.subs)
+            self.stats.increment_counter("prepass.critical", len(critical))
+
+            for c in critical:
+                # blocking the MSS for the singleton MCS {c} adds the unit
+                # clause c to the Map
+                MSS = [x for x in range(1, self.n + 1) if x != c]
+                if not self.map.check_seed(MSS):
+                    continue  # already found (e.g., in a resumed run)
+
+                with self.stats.time('block'):
+                    res = ("S", MSS)
+                    yield res
+
+                    try:
+                        self.subs.increment_MSS()
+                    except AttributeError:
+                        pass
+
+                    self.map.block_down(MSS)
+
+                if self.config['verbose']:
+                    print("- Critical constraint %d: MSS blocked." % c)
+
         for seed, known_max in self.seeds:
 
             if self.config['verbose']:
@@ -148,12 +217,15 @@ class SeedManager(object):
         self.stats = stats
         self.config = config
         self._seed_queue = queue.Queue()
+        self._bias = queue.Queue()   # bias changes requested by the master
 
     def __iter__(self):
         return self
 
     def __next__(self):
         with self.stats.time('seed'):
+            self._update_bias()
+
             if not self._seed_queue.empty():
                 return self._seed_queue.get()
             else:
@@ -165,6 +237,24 @@ class SeedManager(object):
     def add_seed(self, seed, known_max):
         self._seed_queue.put((seed, known_max))
 
+    def request_bias(self, bias):
+        """Switch to another bias ('MUSes' or 'MCSes') before the next seed
+        (called from the receiving thread)."""
+        self._bias.put(bias)
+
+    def _update_bias(self):
+        bias = None
+        while not self._bias.empty():
+            bias = self._bias.get()
+        if bias is None or bias == self.config['bias']:
+            return
+        self.config['bias'] = bias
+        self.map.set_bias(bias == 'MUSes')
+        self.stats.increment_counter("bias.switched")
+        # queued seeds were maximal (or minimal) for the old bias
+        while not self._seed_queue.empty():
+            self._seed_queue.get()
+
     def seed_from_solver(self):
         known_max = self.config['maximize']
         return self.map.next_seed(), known_max
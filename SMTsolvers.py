@@ -1,4 +1,6 @@
 from z3 import *
+import strategies
+import utils
 
 
 def dimacs_var(i):
@@ -39,9 +41,24 @@ class Z3SubsetSolver(object):
     varcache = {}
     idcache = {}
 
+    shrink_strategy = 'deletion'
+    grow_strategy = 'linear'
+
     def __init__(self, filename):
         self.read_constraints(filename)
         self.make_solver()
+        self.stats = utils.Statistics()  # replaced by set_stats() to report out
+        self.cache = None  # optional LatticeCache of known SAT / UNSAT subsets
+
+    def set_stats(self, stats):
+        self.stats = stats
+
+    def set_cache(self, cache):
+        self.cache = cache
+
+    def set_strategies(self, shrink, grow):
+        self.shrink_strategy = shrink
+        self.grow_strategy = grow
 
     def read_constraints(self, filename):
         if filename.endswith('.cnf'):
@@ -71,6 +88,15 @@ class Z3SubsetSolver(object):
         return self.varcache[i]
 
     def check_subset(self, seed, improve_seed=False):
+        if self.cache is not None:
+            is_sat, improved, cached = self.cache.check(seed, self.solve_improved)
+            self.stats.increment_counter('cache.lookups')
+            if cached:
+                self.stats.increment_counter('cache.hits')
+            if improve_seed:
+                return is_sat, improved
+            return is_sat
+
         assumptions = self.to_c_lits(seed)
         is_sat = (self.s.check(assumptions) == sat)
         if improve_seed:
@@ -84,31 +110,47 @@ class Z3SubsetSolver(object):
         else:
             return is_sat
 
+    def solve_improved(self, seed):
+        # check seed in the solver, returning it (if SAT) or an unsat core
+        if self.s.check(self.to_c_lits(seed)) == sat:
+            return True, list(seed)
+        else:
+            return False, self.seed_from_core()
+
     def to_c_lits(self, seed):
         return [self.c_var(i) for i in seed]
 
     def complement(self, aset):
-        return set(range(1, self.n+1)).difference(aset)
+        return utils.BitSet(self.n, aset).complement()
 
     def seed_from_core(self):
         core = self.s.unsat_core()
         return [self.idcache[self.get_id(x)] for x in core]
 
     def shrink(self, seed, hard=[]):
+        if self.shrink_strategy == 'qx':
+            with self.stats.time('shrink.qx'):
+                return strategies.shrink_qx(self, seed, hard)
+
         current = set(seed)
         for i in seed:
             if i not in current or i in hard:
                 # May have been "also-removed"
                 continue
             current.remove(i)
-            if not self.check_subset(current):
+            is_sat, improved = self.check_subset(current, improve_seed=True)
+            if not is_sat:
                 # Remove any also-removed constraints
-                current = set(self.seed_from_core())
+                current = set(improved)
             else:
                 current.add(i)
         return current
 
     def grow(self, seed):
+        if self.grow_strategy == 'progression':
+            with self.stats.time('grow.progression'):
+                return strategies.grow_progression(self, seed, self.complement(seed))
+
         current = seed
 
         for i in self.complement(current):
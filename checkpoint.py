@@ -0,0 +1,135 @@
+"""Checkpointing of enumeration state, so that a long run that is killed
+(by a timeout, preemption, etc.) can be resumed where it left off.
+
+The Map solver's state is exactly the blocking clauses added for the results
+found so far, so a checkpoint is a log of those results.  It is written as a
+binary append-only file: a header with the settings of the run that created
+it, followed by one record per result.  Each result is written (to the OS)
+as soon as it is found, and the file is synced to disk at most once per
+interval, so checkpointing costs little even for very frequent results.  A
+record cut short when the process was killed is discarded (and overwritten)
+on resume.
+
+Binary format (native byte order):
+    header:   magic, version, byte-order mark, length of the settings
+    settings: JSON-encoded dict (input hash and the options that determine
+              the Map solver)
+    records:  int32 kind ('U' or 'S'), int32 length, int32[length] constraints;
+              or int32 'P', 1, int32 count: only the first count outputs of
+              the last result were output (-1: now all of them are)
+"""
+import array
+import json
+import os
+import struct
+import time
+
+MAGIC = b'MRCK'
+VERSION = 1
+BOM = 0x01020304   # to detect files written on a host with different endianness
+HEADER = struct.Struct('=4sIIi')
+
+KINDS = {ord('U'): 'U', ord('S'): 'S'}
+PARTIAL = ord('P')
+
+
+class CheckpointLog(object):
+    """An open checkpoint file, to which results are appended.
+
+    Attributes:
+        settings: The settings dict stored in the file's header.
+        results: The results already in the file when it was opened, as
+                 (kind, constraints) tuples in the order they were found.
+        partial: None, or a (result, count) tuple if only the first count
+                 outputs of the last of those results were output (see
+                 mark_partial()).
+    """
+    def __init__(self, path, settings, interval=60, resume=False):
+        """Open a checkpoint, creating it (replacing any existing file) unless
+        resume is True and the file already exists, in which case its
+        settings and results are read and new results are appended to it.
+
+        Args:
+            path: The checkpoint file.
+            settings: A JSON-serializable dict stored in a new file's header.
+            interval: The maximum number of seconds between syncs to disk.
+            resume: Whether to continue an existing checkpoint.
+
+        Raises:
+            ValueError if resuming from a file that is not a valid checkpoint.
+        """
+        self.path = path
+        self.interval = interval
+        self.results = []
+        self.partial = None
+
+        if resume and os.path.exists(path):
+            self.settings, end = self._read()
+            self._f = open(path, 'r+b')
+            # drop a partial record left by a process that was killed mid-write
+            self._f.truncate(end)
+            self._f.seek(end)
+        else:
+            self.settings = settings
+            data = json.dumps(settings, sort_keys=True).encode('utf-8')
+            self._f = open(path, 'wb')
+            self._f.write(HEADER.pack(MAGIC, VERSION, BOM, len(data)))
+            self._f.write(data)
+            self.sync()
+        self._last_sync = time.time()
+
+    def _read(self):
+        # returns the settings and the end of the last complete record
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        if len(data) < HEADER.size:
+            raise ValueError("Truncated checkpoint file: %s" % self.path)
+        magic, version, bom, size = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION or bom != BOM:
+            raise ValueError("Incompatible checkpoint file: %s" % self.path)
+        start = HEADER.size + size
+        settings = json.loads(data[HEADER.size:start].decode('utf-8'))
+
+        itemsize = array.array('i').itemsize
+        ints = array.array('i', data[start:start + (len(data) - start) // itemsize * itemsize])
+        i = 0
+        while i + 2 <= len(ints) and i + 2 + ints[i+1] <= len(ints):
+            kind, length = ints[i], ints[i+1]
+            if kind == PARTIAL and length == 1 and self.results:
+                count = ints[i+2]
+                self.partial = (self.results[-1], count) if count >= 0 else None
+            elif kind in KINDS:
+                self.results.append((KINDS[kind], list(ints[i+2:i+2+length])))
+                self.partial = None
+            else:
+                raise ValueError("Corrupt checkpoint file: %s" % self.path)
+            i += 2 + length
+        return settings, start + i * ints.itemsize
+
+    def append(self, result):
+        """Record a result (a (kind, constraints) tuple), syncing the file to
+        disk if the last sync was more than interval seconds ago."""
+        self._write([ord(result[0]), len(result[1])] + list(result[1]))
+
+    def mark_partial(self, count):
+        """Record that only the first count outputs of the last result
+        appended (e.g., expanded from collapsed duplicates) were output
+        before stopping, or, with count=None, that all of them now are."""
+        self._write([PARTIAL, 1, -1 if count is None else count])
+
+    def _write(self, record):
+        # (a list of ints, written as int32s)
+        self._f.write(struct.pack('=%di' % len(record), *record))
+        self._f.flush()
+        if time.time() - self._last_sync >= self.interval:
+            self.sync()
+
+    def sync(self):
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._last_sync = time.time()
+
+    def close(self):
+        if not self._f.closed:
+            self.sync()
+            self._f.close()
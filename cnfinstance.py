@@ -0,0 +1,510 @@
+"""Parsing and binary caching of CNF / GCNF instances.
+
+A parsed instance is stored compactly: every clause's literals in one flat
+int32 arena (each clause terminated by a 0), the offset of each clause in
+the arena, one group id per clause, and an index of each group's range of
+clauses (clauses are kept sorted by group, so each group is contiguous).
+The arena and groups are exactly what MinisatSubsetSolver hands to the
+solver library, and the whole instance can be written to a binary file that
+later loads (and other processes) map directly into memory instead of
+parsing the DIMACS text again.
+
+Binary format (native byte order):
+    header:        magic, version, byte-order mark, nvars, nclauses, n, nlits
+    offsets:       int64[nclauses+1]  (start of each clause in lits, plus the end)
+    lits:          int32[nlits]       (0-terminated clauses)
+    groups:        int32[nclauses]    (group id of each clause; 0 = hard)
+    group_starts:  int32[n+2]         (group g is clauses group_starts[g] to group_starts[g+1]-1)
+"""
+import array
+import bz2
+import gzip
+import hashlib
+import io
+import itertools
+import mmap
+import os
+import struct
+import tempfile
+import zlib
+try:
+    import lzma
+except ImportError:
+    lzma = None   # only needed for xz-compressed input
+
+MAGIC = b'MRCI'
+VERSION = 2
+BOM = 0x01020304   # to detect files written on a host with different endianness
+HEADER = struct.Struct('=4sII4q')
+HEADER_SIZE = 64   # header is padded so the arrays that follow are aligned
+CACHE_EXT = '.mci'
+
+BUFSIZE = 1 << 20  # read input in large chunks
+
+# array typecode of the int64 offsets (Python 2's array has no 'q', but its
+# 'l' is 64 bits on LP64 platforms; load_binary() checks the sizes)
+try:
+    OFFSET_CODE = array.array('q').typecode
+except ValueError:
+    OFFSET_CODE = 'l'
+
+# compressed input is recognized by its first bytes, not by filename
+GZIP_MAGIC = b'\x1f\x8b'
+BZ2_MAGIC = b'BZh'
+XZ_MAGIC = b'\xfd7zXZ\x00'
+
+
+class CNFInstance(object):
+    """A parsed CNF or GCNF instance.
+
+    Attributes:
+        nvars: The number of variables in the instance.
+        nclauses: The number of clauses in the instance.
+        n: The number of soft constraints (clauses for CNF, groups for GCNF).
+        lits: A flat int32 sequence of all clauses' literals, each clause
+              terminated by a 0 (an array, or a memoryview into a mapped file).
+        offsets: An int64 sequence with the start of every clause in lits,
+                 plus one final entry for the end of the arena.
+        groups: An int32 sequence with the group id of every clause
+                (group 0 is "hard"; group i is soft constraint i).
+        group_starts: An int32 sequence indexing the (contiguous) range of
+                      clauses in each group, from group 0 to group n.
+        path: The binary file backing this instance, if any.
+    """
+    def __init__(self, nvars, nclauses, n, lits, offsets, groups, group_starts, path=None):
+        self.nvars = nvars
+        self.nclauses = nclauses
+        self.n = n
+        self.lits = lits
+        self.offsets = offsets
+        self.groups = groups
+        self.group_starts = group_starts
+        self.path = path
+
+    def clause(self, i):
+        """Get clause i's literals (including its terminating 0)."""
+        return self.lits[self.offsets[i]:self.offsets[i+1]]
+
+    def group_clauses(self, groupid):
+        """Get the range of clause indexes in a group (0 = hard clauses)."""
+        return range(self.group_starts[groupid], self.group_starts[groupid+1])
+
+    def group_lits(self, groupid):
+        """Get the literals of all of a group's clauses (each 0-terminated)
+        as a single slice of the arena."""
+        return self.lits[self.offsets[self.group_starts[groupid]]:self.offsets[self.group_starts[groupid+1]]]
+
+    # Instances backed by a file are pickled (e.g., when sent to a child
+    # process) as just their path and re-mapped on the other side.
+    def __getstate__(self):
+        if self.path is not None:
+            return {'path': self.path}
+        return self.__dict__
+
+    def __setstate__(self, state):
+        if 'lits' not in state:
+            state = load_binary(state['path']).__dict__
+        self.__dict__.update(state)
+
+
+def parse_dimacs(f):
+    """Parse a DIMACS CNF or GCNF file (given as a binary file object).
+
+    Returns:
+        A CNFInstance.
+    """
+    lits = array.array('i')
+    offsets = array.array(OFFSET_CODE, [0])
+    groups = array.array('i')
+    n = 0
+    i = 0
+    for line in f:
+        if line.startswith(b'p'):
+            tokens = line.split()
+            gcnf_in = (tokens[1] == b"gcnf")
+            nvars = int(tokens[2])
+            nclauses = int(tokens[3])
+
+            # n = number of soft constraints
+            if gcnf_in:
+                n = int(tokens[4])
+            else:
+                n = nclauses
+            continue
+
+        if line.startswith(b'c'):
+            continue
+
+        line = line.strip()
+        if line == b'':
+            continue
+
+        # anything else is a clause
+        assert n > 0
+        vals = line.split()
+        assert vals[-1] == b'0'
+
+        if gcnf_in:
+            groupid = int(vals[0][1:-1])  # "parse" the '{x}' group ID
+            assert 0 <= groupid <= n
+            lits.extend(map(int, vals[1:]))  # includes the terminating 0
+        else:
+            groupid = i+1
+            lits.extend(map(int, vals))
+        offsets.append(len(lits))
+        groups.append(groupid)
+
+        i += 1
+
+    assert i == nclauses
+
+    return _group_clauses(nvars, n, lits, offsets, groups)
+
+
+def _group_clauses(nvars, n, lits, offsets, groups):
+    """Build a CNFInstance from parsed clauses, first (stably) reordering
+    them by group if needed so that every group is a contiguous range."""
+    # counting sort: group_starts[g] = index of the first clause in group g
+    group_starts = array.array('i', [0] * (n+2))
+    for g in groups:
+        group_starts[g+1] += 1
+    for g in range(n+1):
+        group_starts[g+1] += group_starts[g]
+
+    if any(groups[j] > groups[j+1] for j in range(len(groups)-1)):
+        next_clause = group_starts[:-1]   # next free slot for each group
+        order = [0] * len(groups)
+        for j, g in enumerate(groups):
+            order[next_clause[g]] = j
+            next_clause[g] += 1
+
+        sorted_lits = array.array('i')
+        sorted_offsets = array.array(OFFSET_CODE, [0])
+        for j in order:
+            sorted_lits.extend(lits[offsets[j]:offsets[j+1]])
+            sorted_offsets.append(len(sorted_lits))
+        lits = sorted_lits
+        offsets = sorted_offsets
+        groups = array.array('i', (groups[j] for j in order))
+
+    return CNFInstance(nvars, len(groups), n, lits, offsets, groups, group_starts)
+
+
+class _InputReader(io.RawIOBase):
+    """A raw binary stream over an already-open input that first returns a
+    few bytes that were read ahead (to sniff the format) and optionally
+    hashes everything that passes through it.
+    """
+    def __init__(self, stream, prefix=b'', hasher=None):
+        self._stream = stream
+        self._prefix = prefix
+        self._hasher = hasher
+        if hasher is not None:
+            hasher.update(prefix)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self._prefix:
+            count = min(len(b), len(self._prefix))
+            b[:count] = self._prefix[:count]
+            self._prefix = self._prefix[count:]
+            return count
+        data = self._stream.read(len(b))
+        if self._hasher is not None:
+            self._hasher.update(data)
+        count = len(data)
+        b[:count] = data
+        return count
+
+
+class _Decompressor(io.RawIOBase):
+    """A raw binary stream of the data decompressed from another stream by a
+    decompressor object (as from zlib.decompressobj()), for Python 2, whose
+    GzipFile needs a seekable file and whose BZ2File needs a filename.
+    """
+    def __init__(self, stream, decompressor):
+        self._stream = stream
+        self._decompressor = decompressor
+        self._pending = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._pending:
+            data = self._stream.read(BUFSIZE)
+            if not data:
+                return 0
+            self._pending = self._decompressor.decompress(data)
+        count = min(len(b), len(self._pending))
+        b[:count] = self._pending[:count]
+        self._pending = self._pending[count:]
+        return count
+
+
+def _decompress(stream, magic):
+    # a stream decompressing gzip / bzip2 / xz data (given its magic bytes)
+    if hasattr(bz2, 'open'):
+        if magic.startswith(GZIP_MAGIC):
+            return gzip.GzipFile(fileobj=stream, mode='rb')
+        if magic.startswith(BZ2_MAGIC):
+            return bz2.BZ2File(stream, 'rb')
+        return lzma.LZMAFile(stream, 'rb')
+    # (Python 2)
+    if magic.startswith(GZIP_MAGIC):
+        return _Decompressor(stream, zlib.decompressobj(16 + zlib.MAX_WBITS))
+    if magic.startswith(BZ2_MAGIC):
+        return _Decompressor(stream, bz2.BZ2Decompressor())
+    return _Decompressor(stream, lzma.LZMADecompressor())
+
+
+def open_input(infile, hasher=None):
+    """Open an input for a single streaming pass.  Works on any readable file
+    object (including stdin and pipes), never reopening it by name, and
+    transparently decompresses gzip, bzip2, and xz data, detected by their
+    magic bytes.
+
+    Args:
+        infile: An open file object (binary, or text with a .buffer).
+        hasher: An optional hashlib object updated with the raw bytes read.
+
+    Returns:
+        A buffered binary stream of the (decompressed) contents.
+    """
+    raw = getattr(infile, 'buffer', infile)   # e.g., text-mode sys.stdin
+    magic = raw.read(len(XZ_MAGIC))
+    stream = io.BufferedReader(_InputReader(raw, magic, hasher), BUFSIZE)
+
+    if magic.startswith(XZ_MAGIC) and lzma is None:
+        raise IOError("Reading xz-compressed input requires the lzma module.")
+    if not any(magic.startswith(m) for m in (GZIP_MAGIC, BZ2_MAGIC, XZ_MAGIC)):
+        return stream
+
+    return io.BufferedReader(_decompress(stream, magic), BUFSIZE)
+
+
+def read_dimacs(infile, hasher=None):
+    """Parse a CNF / GCNF instance from an open file (possibly compressed)."""
+    return parse_dimacs(open_input(infile, hasher))
+
+
+def content_hash(infile):
+    """Get a hash of a seekable file's (raw, possibly compressed) contents,
+    leaving it positioned back at the start.
+    """
+    raw = getattr(infile, 'buffer', infile)
+    h = hashlib.sha1()
+    pos = raw.tell()
+    for chunk in iter(lambda: raw.read(BUFSIZE), b''):
+        h.update(chunk)
+    raw.seek(pos)
+    return h.hexdigest()
+
+
+def _seekable(infile):
+    raw = getattr(infile, 'buffer', infile)
+    try:
+        return raw.seekable()
+    except (AttributeError, ValueError):
+        return False
+
+
+def write_binary(inst, path):
+    """Write an instance to a binary file.  The file is written under a
+    temporary name and renamed into place, so concurrent readers never see a
+    partial file.
+    """
+    dirname = os.path.dirname(path) or '.'
+    with tempfile.NamedTemporaryFile('wb', dir=dirname, delete=False) as f:
+        header = HEADER.pack(MAGIC, VERSION, BOM, inst.nvars, inst.nclauses, inst.n, len(inst.lits))
+        f.write(header)
+        f.write(b'\0' * (HEADER_SIZE - len(header)))
+        for seq in (inst.offsets, inst.lits, inst.groups, inst.group_starts):
+            f.write(_as_bytes(seq))
+    os.rename(f.name, path)
+
+
+def load_binary(path):
+    """Map a binary instance file into memory.  The clause arena and its
+    indexes are not copied; they are memoryviews into a private
+    (copy-on-write) mapping of the file.  (In Python 2, they are arrays
+    copied from the mapping.)
+
+    Raises:
+        ValueError if the file is not a valid instance file for this version
+        and platform.
+    """
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    if len(mm) < HEADER_SIZE:
+        raise ValueError("Truncated instance file: %s" % path)
+    magic, version, bom, nvars, nclauses, n, nlits = HEADER.unpack_from(mm, 0)
+    if magic != MAGIC or version != VERSION or bom != BOM:
+        raise ValueError("Incompatible instance file: %s" % path)
+    sections = [(OFFSET_CODE, nclauses+1), ('i', nlits), ('i', nclauses), ('i', n+2)]
+    size = HEADER_SIZE + sum(array.array(code).itemsize * count for code, count in sections)
+    if len(mm) != size:
+        raise ValueError("Truncated instance file: %s" % path)
+
+    arrays = []
+    pos = HEADER_SIZE
+    for code, count in sections:
+        end = pos + array.array(code).itemsize * count
+        arrays.append(_view_as(mm, pos, end, code))
+        pos = end
+    offsets, lits, groups, group_starts = arrays
+    return CNFInstance(nvars, nclauses, n, lits, offsets, groups, group_starts, path=path)
+
+
+def load(infile, cache_dir=None, digest=None):
+    """Load a CNF / GCNF instance from an open file.
+
+    If cache_dir is given, a binary copy of the parsed instance is kept there,
+    keyed by a hash of the file's contents (digest, if the caller already
+    has it from content_hash()): it is mapped directly if it already exists,
+    and written (then mapped) after parsing if not.  A non-seekable input
+    (e.g., a pipe) is hashed as it is parsed, so it is still read only once.
+
+    Returns:
+        A CNFInstance.
+    """
+    if cache_dir is None:
+        return read_dimacs(infile)
+
+    if _seekable(infile):
+        if digest is None:
+            digest = content_hash(infile)
+        path = os.path.join(cache_dir, digest + CACHE_EXT)
+        if os.path.exists(path):
+            try:
+                return load_binary(path)
+            except ValueError:
+                pass  # stale or damaged; parse and overwrite it
+        inst = read_dimacs(infile)
+    else:
+        hasher = hashlib.sha1()
+        inst = read_dimacs(infile, hasher)
+        path = os.path.join(cache_dir, hasher.hexdigest() + CACHE_EXT)
+
+    try:
+        os.makedirs(cache_dir)
+    except OSError:
+        if not os.path.isdir(cache_dir):
+            raise
+    write_binary(inst, path)
+    return load_binary(path)
+
+
+def _view_as(mm, start, end, code):
+    # a memoryview of the given typecode into mm[start:end], or in Python 2
+    # (whose memoryviews cannot be cast), an array copied from it
+    if hasattr(memoryview, 'cast'):
+        return memoryview(mm)[start:end].cast(code)
+    result = array.array(code)
+    result.fromstring(mm[start:end])
+    return result
+
+
+def _as_bytes(seq):
+    if isinstance(seq, array.array):
+        # (tostring() in Python 2)
+        return seq.tobytes() if hasattr(seq, 'tobytes') else seq.tostring()
+    return bytes(seq)
+
+
+class Reduction(object):
+    """The map from the soft constraints of an instance reduced by
+    reduce_instance() back to those of the original.
+
+    Each constraint of the reduced instance stands for a class of original
+    constraints that are syntactically identical (see duplicate_classes()).
+    A MUS contains at most one constraint of each class (any other would be
+    redundant), so a MUS of the reduced instance stands for every choice of
+    one member from each of its constraints' classes.  An MSS contains
+    either all or none of a class, so an MSS of the reduced instance stands
+    for the union of its classes.  Constraints dropped altogether are in
+    every MSS (and no MUS).
+
+    Attributes:
+        n: The number of soft constraints in the original instance.
+        classes: The original constraints (a sorted list) that each
+                 constraint of the reduced instance stands for, from
+                 constraint 1.
+        always: The original constraints that were dropped.
+    """
+    def __init__(self, n, classes, always=()):
+        self.n = n
+        self.classes = classes
+        self.always = list(always)
+
+    def expand(self, result):
+        """Generate the results over the original constraints that a result
+        ((kind, constraints) tuple) over the reduced ones stands for."""
+        kind, subset = result
+        classes = [self.classes[i-1] for i in subset]
+        if kind == 'U':
+            for choice in itertools.product(*classes):
+                yield (kind, sorted(choice))
+        else:
+            yield (kind, sorted(itertools.chain(self.always, *classes)))
+
+
+def duplicate_classes(inst, constraints=None):
+    """Partition soft constraints (by default, all of inst's) into classes of
+    syntactically identical ones: clauses with the same literals, or groups
+    with the same clauses, ignoring order and repetition.
+
+    Returns:
+        A list of classes (sorted lists), in order of their first members.
+    """
+    if constraints is None:
+        constraints = range(1, inst.n+1)
+    classes = []
+    index = {}   # class key -> position in classes
+    for g in constraints:
+        key = frozenset(frozenset(inst.clause(c)[:-1]) for c in inst.group_clauses(g))
+        if key in index:
+            classes[index[key]].append(g)
+        else:
+            index[key] = len(classes)
+            classes.append([g])
+    return classes
+
+
+def reduce_instance(inst, classes, always=()):
+    """Reduce an instance to one soft constraint per class of (identical)
+    constraints, the first of each class, dropping the constraints in
+    always entirely.
+
+    Args:
+        inst: A CNFInstance.
+        classes: A list of classes (sorted lists of constraints, in order of
+                 their first members), covering every constraint not in
+                 always.
+        always: Constraints known to be in every MSS and no MUS.
+
+    Returns:
+        The reduced instance (with representatives renumbered from 1, in
+        order) and the Reduction mapping it back to inst.
+    """
+    newid = array.array('i', [0] * (inst.n+1))   # 0 for dropped groups (not group 0)
+    for i, members in enumerate(classes):
+        newid[members[0]] = i+1
+
+    lits = array.array('i')
+    offsets = array.array(OFFSET_CODE, [0])
+    groups = array.array('i')
+    for g in range(inst.n+1):
+        if g > 0 and newid[g] == 0:
+            continue
+        lits.extend(inst.group_lits(g))
+        for c in inst.group_clauses(g):
+            offsets.append(offsets[-1] + inst.offsets[c+1] - inst.offsets[c])
+            groups.append(newid[g])
+
+    # groups are still in order, so this only builds the group index
+    reduced = _group_clauses(inst.nvars, len(classes), lits, offsets, groups)
+    return reduced, Reduction(inst.n, classes, always)
@@ -0,0 +1,233 @@
+"""Distributed enumeration over TCP.
+
+A coordinator (marco.py --listen) runs the master of parallel mode
+(run_master()) with remote workers (marco.py --connect) in place of, or in
+addition to, its local children.  Each worker loads the instance itself and
+exchanges the same messages with the coordinator as a local child does over
+its pipe (results, 'done', 'complete', 'terminate'), over a connection from
+multiprocessing.connection authenticated with a shared key.
+
+Workers may join at any time: the coordinator first checks that a joining
+worker has the same input (by its hash, so the input cannot be a pipe) and
+the settings that determine the constraints' numbering, then sends it every
+result found so far.  A worker that leaves (or is lost) is just dropped; as
+every worker explores the whole lattice, nothing is left unexplored because
+of it.  The coordinator stops when a worker completes the enumeration, or
+when every worker has finished its work (e.g., enumerating only MCSes)
+without one doing so, as in parallel mode.
+
+Results are sent in batches (see BatchingConnection), so a burst of small
+results costs one message, not one round trip per result.
+"""
+import collections
+import errno
+import fcntl
+import os
+import socket
+import threading
+import time
+from multiprocessing.connection import Client, Listener, AuthenticationError
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+DELAY = 0.05            # seconds a result may wait to be batched with others
+BATCH_SIZE = 256        # results sent in one message at most
+HANDSHAKE_TIMEOUT = 10  # seconds a new connection has to introduce itself
+
+
+class BatchingConnection(object):
+    """Wraps a multiprocessing.connection Connection (with the same send(),
+    recv(), poll(), and fileno() methods), sending results in batches.
+
+    A result passed to send() is held until BATCH_SIZE results are waiting,
+    DELAY seconds have passed, or another message is sent (which goes after
+    them, preserving the order).  recv() unpacks batches, returning one
+    result at a time.  Errors sending to a closed connection are ignored
+    (the closed connection is noticed when receiving from it).
+    """
+    def __init__(self, conn, eof_terminates=False):
+        """
+        Args:
+            conn: The connection.
+            eof_terminates: If True, recv() returns 'terminate' when the
+                            connection is closed, rather than raising
+                            EOFError (for a worker, whose coordinator is gone).
+        """
+        self.conn = conn
+        self.eof_terminates = eof_terminates
+        self.closed = False
+        self._out = []
+        self._in = collections.deque()
+        self._lock = threading.Lock()
+        self._waiting = threading.Event()
+
+        flusher = threading.Thread(target=self._flusher)
+        flusher.daemon = True
+        flusher.start()
+
+    def fileno(self):
+        return self.conn.fileno()
+
+    def send(self, msg):
+        with self._lock:
+            is_result = msg[0] in ('U', 'S')
+            if is_result:
+                self._out.append(msg)
+                if len(self._out) < BATCH_SIZE:
+                    self._waiting.set()
+                    return
+            self._flush()
+            if not is_result:
+                self._send(msg)
+
+    def poll(self, timeout=0.0):
+        return bool(self._in) or self.conn.poll(timeout)
+
+    def recv(self):
+        while not self._in:
+            try:
+                msg = self.conn.recv()
+            except (EOFError, OSError, socket.error):   # (socket.error: Python 2)
+                if self.eof_terminates:
+                    return 'terminate'
+                raise EOFError
+            if msg[0] != 'batch':
+                return msg
+            self._in.extend(msg[1])
+        return self._in.popleft()
+
+    def _flush(self):
+        if self._out:
+            self._send(('batch', self._out))
+            self._out = []
+
+    def _send(self, msg):
+        if self.closed:
+            return
+        try:
+            self.conn.send(msg)
+        except (EOFError, OSError, socket.error):
+            self.closed = True
+
+    def _flusher(self):
+        while True:
+            self._waiting.wait()
+            time.sleep(DELAY)
+            with self._lock:
+                self._waiting.clear()
+                self._flush()
+
+
+class Hub(object):
+    """Accepts workers in a coordinator, in a background thread.
+
+    The hub listens from its creation, but accepts workers only once
+    start() is called (after any local children are forked, so that they
+    do not inherit the acceptor's state).  It is readable (for select())
+    when workers have joined; joined() returns their connections.
+    """
+    def __init__(self, address, authkey, settings):
+        """
+        Args:
+            address: The (host, port) to listen on.
+            authkey: The key (bytes) workers must have.
+            settings: A dict that must equal each worker's (see connect()).
+
+        Raises:
+            OSError (socket.error in Python 2) if the address cannot be
+            listened on.
+        """
+        self.settings = settings
+        self.listener = Listener(address, authkey=authkey)
+        self._joined = queue.Queue()
+        self._notify_r, self._notify_w = os.pipe()
+        flags = fcntl.fcntl(self._notify_r, fcntl.F_GETFL)
+        fcntl.fcntl(self._notify_r, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+    def start(self):
+        """Start accepting workers, in a background thread."""
+        acceptor = threading.Thread(target=self._accept)
+        acceptor.daemon = True
+        acceptor.start()
+
+    @property
+    def address(self):
+        return self.listener.address
+
+    def fileno(self):
+        return self._notify_r
+
+    def joined(self):
+        """Get the connections (BatchingConnections) of the workers that
+        joined since the last call."""
+        try:
+            while os.read(self._notify_r, 4096):
+                pass
+        except OSError as e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+        conns = []
+        while not self._joined.empty():
+            conns.append(self._joined.get())
+        return conns
+
+    def _accept(self):
+        while True:
+            try:
+                conn = self.listener.accept()
+            except (AuthenticationError, EOFError, OSError, socket.error):
+                continue   # a client with the wrong key, or one that left
+
+            try:
+                if not conn.poll(HANDSHAKE_TIMEOUT):
+                    conn.close()
+                    continue
+                hello = conn.recv()
+                theirs = hello[1] if hello[0] == 'hello' else {}
+                if theirs.get('input') is None:
+                    # (an input that could not be hashed cannot be checked)
+                    conn.send(('refused', "the worker's input could not be checked against the coordinator's"))
+                    conn.close()
+                    continue
+                if theirs != self.settings:
+                    differ = sorted(k for k in set(theirs) | set(self.settings) if theirs.get(k) != self.settings.get(k))
+                    conn.send(('refused', "input or settings differ from the coordinator's (%s)" % ", ".join(differ)))
+                    conn.close()
+                    continue
+                conn.send('welcome')
+            except (EOFError, OSError, socket.error):
+                continue
+
+            self._joined.put(BatchingConnection(conn))
+            os.write(self._notify_w, b'.')
+
+
+def connect(address, authkey, settings):
+    """Join a coordinator as a worker.
+
+    Args:
+        address: The coordinator's (host, port).
+        authkey: The coordinator's key (bytes).
+        settings: A dict describing the input (its hash, under 'input')
+                  and the settings that determine the constraints'
+                  numbering, which must equal the coordinator's.
+
+    Returns:
+        The connection to the coordinator, a BatchingConnection.
+
+    Raises:
+        OSError (socket.error in Python 2) if the coordinator cannot be
+        reached,
+        AuthenticationError if the key is wrong,
+        ValueError if the coordinator refuses the worker.
+    """
+    conn = Client(address, authkey=authkey)
+    conn.send(('hello', settings))
+    reply = conn.recv()
+    if reply != 'welcome':
+        conn.close()
+        raise ValueError("Coordinator refused the connection: %s" % reply[1])
+    return BatchingConnection(conn, eof_terminates=True)
@@ -1,5 +1,7 @@
 import abc
 import array
+import collections
+import utils
 from pyminisolvers import minisolvers
 
 
@@ -8,7 +10,7 @@ class MapSolver(object):
     __metaclass__ = abc.ABCMeta
 
     @abc.abstractmethod  # must be overridden, but can be called via super()
-    def __init__(self, n, bias=True, dump=None):
+    def __init__(self, n, bias=True, dump=None, index=False):
         """Common initialization.
 
         Args:
@@ -16,11 +18,59 @@ class MapSolver(object):
             bias: Boolean specifying the solver's bias.  True is a
                   high/inclusion/MUS bias; False is a low/exclusion/MSS bias;
                   None is no bias.
+            index: Boolean specifying whether to keep an index of the
+                   blocking clauses (see add_blocking_clause()).  It holds
+                   every blocking clause, unbounded, so it can take far
+                   more memory than the solver itself.
         """
         self.n = n
         self.bias = bias
-        self.all_n = set(range(1, n+1))  # used in complement fairly frequently
         self.dump = dump
+        self.blocks = utils.SetTrie() if index else None   # blocking clauses added so far
+        self.dead_vars = 0                # activation variables of removed temporary clauses, not recycled
+        self.stats = utils.Statistics()  # replaced by set_stats() to report out
+        self._implies = None              # implies() (without assumptions), kept up to date incrementally
+        self._implies_read = 0            # number of the solver's implications read into it
+        self._inbox = collections.deque() # results received from other threads, not yet blocked
+        self._feed = None                 # optional source of results found elsewhere (see set_feed())
+
+    def set_stats(self, stats):
+        self.stats = stats
+
+    @utils.unsynchronized
+    def receive(self, result):
+        """Queue a result (a ('U', MUS) or ('S', MSS) tuple) found elsewhere,
+        to be blocked by add_received() at the next point where the map is
+        queried (next_seed(), check_seed(), or implies()).
+
+        This can be called from any thread at any time, without waiting
+        for the lock of a synchronized map solver (see
+        utils.synchronize_class()), so receiving results never stalls
+        behind a long solver call in the thread using the map.
+        """
+        self._inbox.append(result)
+
+    def set_feed(self, feed):
+        """Set a function returning a list of results found elsewhere (e.g.,
+        reading them from a resultbus.ResultBus) that add_received() calls
+        to collect new results, in addition to those queued by receive()."""
+        self._feed = feed
+
+    def add_received(self):
+        """Block all results queued by receive() or available from the feed
+        so far."""
+        if self._feed is not None:
+            self._inbox.extend(self._feed())
+        count = 0
+        while self._inbox:
+            kind, subset = self._inbox.popleft()
+            if kind == 'S':
+                self.block_down(subset)
+            else:
+                self.block_up(subset)
+            count += 1
+        if count:
+            self.stats.add_stat("map.received_batch", count)
 
     @abc.abstractmethod
     def next_seed(self):
@@ -32,6 +82,7 @@ class MapSolver(object):
         Returns:
             True if seed is unexplored (i.e., its corresponding assignment is a model)
         """
+        self.add_received()
         return self._solver.check_complete(positive_lits=seed)
 
     def implies(self, assumptions=None):
@@ -39,10 +90,35 @@ class MapSolver(object):
         If assumptions are provided, get implications of the current
         instance w.r.t. those assumptions.
 
+        Without assumptions, the result is maintained incrementally: each
+        call only fetches the implications added since the last one (as
+        blocking clauses are added, they only grow).  It must not be
+        modified.
+
         Returns:
             An array of literals.
         """
-        return self._solver.implies(assumptions)
+        self.add_received()
+        if assumptions is not None:
+            return self._filter_implies(self._solver.implies(assumptions))
+        if self._implies is None:
+            self._implies = array.array('i')
+            self._implies_read = 0
+        new = self._solver.implies_since(self._implies_read)
+        if new is None:
+            # the Map formula is unsatisfiable (no seeds remain)
+            return array.array('i')
+        self._implies_read += len(new)
+        self._implies.extend(self._filter_implies(new))
+        self.stats.add_stat("map.implies_new", len(new))
+        return self._implies
+
+    def _filter_implies(self, implications):
+        return implications
+
+    def invalidate_implies(self):
+        """Rebuild the implies() result from scratch on its next call."""
+        self._implies = None
 
     def find_above(self, seed):
         """Look for and return any unexplored point including the given seed.
@@ -86,20 +162,21 @@ class MapSolver(object):
         """
         while True:
             comp = self.complement(seed)
-            tmpvar = self._solver.new_var() + 1
             if direction:
                 # search for a solution w/ all of the current seed plus at
                 # least one from the current complement.
-                self._solver.add_clause([-tmpvar] + list(comp))  # temporary clause
+                tmpvar = self._solver.add_temp_clause(comp.to_array())
                 # activate the temporary clause and all seed clauses
                 havenew = self._solver.solve([tmpvar] + list(seed))
             else:
                 # search for a solution w/ none of current complement and at
                 # least one from the current seed removed.
-                self._solver.add_clause([-tmpvar] + [-i for i in seed])  # temporary clause
+                tmpvar = self._solver.add_temp_clause([-i for i in seed])
                 # activate the temporary clause and deactivate complement clauses
                 havenew = self._solver.solve([tmpvar] + [-i for i in comp])
-            self._solver.add_clause([-tmpvar])  # remove the temporary clause
+            if not self._solver.remove_temp_clause(tmpvar):
+                self.dead_vars += 1
+            self.invalidate_implies()
 
             if havenew:
                 seed = self.get_seed()
@@ -108,7 +185,7 @@ class MapSolver(object):
 
     def complement(self, aset):
         """Return the complement of a given set w.r.t. the set of mapped constraints."""
-        return self.all_n.difference(aset)
+        return utils.BitSet(self.n, aset).complement()
 
     def add_clause(self, clause):
         """Add a given clause to the Map solver."""
@@ -116,20 +193,41 @@ class MapSolver(object):
         if self.dump is not None:
             self.dump.write(" ".join(str(lit) for lit in clause) + " 0\n")
 
+    def add_blocking_clause(self, clause):
+        """Add a blocking clause to the Map solver.  With an index of the
+        blocking clauses, skip it if it is a duplicate of, or subsumed by
+        (i.e., a superset of), one added before.
+
+        Returns:
+            True if the clause was added.
+        """
+        if self.blocks is not None:
+            if self.blocks.has_subset(clause):
+                if self.blocks.contains(clause):
+                    self.stats.increment_counter("map.blocks_duplicate")
+                else:
+                    self.stats.increment_counter("map.blocks_subsumed")
+                return False
+            self.blocks.add(clause)
+            self.stats.increment_counter("map.index.clauses")
+            self.stats.increment_counter("map.index.literals", len(clause))
+        self.add_clause(clause)
+        return True
+
     def block_down(self, frompoint):
         """Block down from a given set."""
-        clause = self.complement(frompoint)
-        self.add_clause(clause)
+        clause = self.complement(frompoint).to_array()
+        self.add_blocking_clause(clause)
 
     def block_up(self, frompoint):
         """Block up from a given set."""
         clause = [-i for i in frompoint]
-        self.add_clause(clause)
+        self.add_blocking_clause(clause)
 
 
 class MinicardMapSolver(MapSolver):
-    def __init__(self, n, bias=True, rand_seed=None):   # bias=True is a high/inclusion/MUS bias; False is a low/exclusion/MSS bias.
-        super(MinicardMapSolver, self).__init__(n, bias)
+    def __init__(self, n, bias=True, rand_seed=None, dump=None, index=False):   # bias=True is a high/inclusion/MUS bias; False is a low/exclusion/MSS bias.
+        super(MinicardMapSolver, self).__init__(n, bias, dump, index)
 
         if bias:
             self.k = n  # initial lower bound on # of True variables
@@ -137,6 +235,7 @@ class MinicardMapSolver(MapSolver):
             self.k = 0
 
         self._solver = minisolvers.MinicardSolver()
+        self.size_blocked = False   # whether block_above_size() / block_below_size() were used
 
         # Initialize random seed and randomize variable activity if seed is given
         if rand_seed is not None:
@@ -175,72 +274,252 @@ class MinicardMapSolver(MapSolver):
         For MinicardMapSolver, we have to make sure to effectively disable the
         cardinality constraint.  When bias=True, this requires setting its auxiliary
         variables to True (hence including them in positive_lits in check_complete).
+        When bias=False, leaving them False (the default) does the same.
+
+        check_complete() is slow with the cardinality constraint, though, so
+        given an index of the blocking clauses, and unless other size
+        constraints have been added, the seed is instead checked directly
+        against the index: it is explored iff it falsifies one of them.
 
         Returns:
             True if seed is unexplored (i.e., its corresponding assignment is a model)
         """
-        positive_lits = seed + array.array('i', range(self.n+1, self.n*2+1))
+        self.add_received()
+        if self.blocks is not None and not self.size_blocked:
+            trues = utils.BitSet(self.n, seed)
+            # a literal is false iff it is negative and in the seed or positive and not
+            return not self.blocks.has_subset_where(lambda x: (-x in trues) if x < 0 else (x not in trues))
+
+        positive_lits = array.array('i', seed)
+        if self.bias:
+            positive_lits.extend(range(self.n+1, self.n*2+1))
         ret = self._solver.check_complete(positive_lits)
         return ret
 
+    def _filter_implies(self, implications):
+        # only report implications over the constraint variables
+        # (not the bound-setting or temporary variables)
+        return array.array('i', [x for x in implications if -self.n <= x <= self.n])
+
     def next_seed(self):
         '''
-            Find the next *maximum* model.
+            Find the next *maximum* model (or *minimum*, with a low bias).
+
+            The bound k only ever moves toward 0 (n for a low bias) as the
+            map is blocked.  When the current bound is infeasible, the next
+            feasible one is found by galloping away from it (1, 2, 4, ...
+            steps) and then bisecting, rather than trying each bound in turn.
         '''
+        self.add_received()
         if self.solve_with_bound(self.k):
             return self.get_seed()
 
-        if self.bias:
-            if not self.solve_with_bound(0):
-                # no more models
-                return None
-            # move to the next bound
-            self.k -= 1
-        else:
-            if not self.solve_with_bound(self.n):
+        step = -1 if self.bias else 1
+        limit = 0 if self.bias else self.n
+
+        # gallop: find a feasible bound, with bad the last infeasible one
+        bad = self.k
+        while True:
+            k = bad + step
+            if (k - limit) * step > 0:
+                k = limit
+            if self.solve_with_bound(k):
+                good = k
+                break
+            if k == limit:
                 # no more models
                 return None
-            # move to the next bound
-            self.k += 1
-
-        while not self.solve_with_bound(self.k):
-            if self.bias:
-                self.k -= 1
+            bad = k
+            step *= 2
+
+        # bisect between them for the tightest feasible bound
+        have_model = True   # whether the last call found a model at good
+        while abs(bad - good) > 1:
+            mid = (bad + good) // 2
+            if self.solve_with_bound(mid):
+                good = mid
+                have_model = True
             else:
-                self.k += 1
+                bad = mid
+                have_model = False
 
+        self.k = good
         assert 0 <= self.k <= self.n
+        if not have_model:
+            self.solve_with_bound(self.k)
 
         return self.get_seed()
 
     def block_above_size(self, size):
         self._solver.add_atmost( [(x+1) for x in range(self.n)], size)
         self.k = min(size, self.k)
+        self.size_blocked = True
 
     def block_below_size(self, size):
         self._solver.add_atmost( [-(x+1) for x in range(self.n)], self.n-size)
         self.k = min(size, self.k)
+        self.size_blocked = True
 
 
 class MinisatMapSolver(MapSolver):
-    def __init__(self, n, bias=True, rand_seed=None, dump=None):   # bias=True is a high/inclusion/MUS bias; False is a low/exclusion/MSS bias; None is no bias.
-        super(MinisatMapSolver, self).__init__(n, bias, dump)
+    def __init__(self, n, bias=True, rand_seed=None, dump=None, compact=None, index=False):   # bias=True is a high/inclusion/MUS bias; False is a low/exclusion/MSS bias; None is no bias.
+        """
+        Args:
+            compact: If given, rebuild the solver (see compact()) whenever
+                     this many clauses can be dropped (blocking clauses
+                     subsumed by ones added after them, and temporary
+                     clauses whose activation variables are dead), and
+                     whenever the blocking clauses have doubled in number
+                     (and reach this many) since the last rebuild.
+                     Rebuilding needs the index of blocking clauses, so
+                     this implies index.
+
+        Activation variables are normally recycled as their temporary
+        clauses are removed (see remove_temp_clause()), so dead_vars only
+        counts those the solver failed to release: it is a fallback, and
+        compaction is mostly driven by subsumption and growth.
+        """
+        super(MinisatMapSolver, self).__init__(n, bias, dump, index or bool(compact))
+        self.rand_seed = rand_seed
+        self.compact_threshold = compact
+        self.subsumed = 0           # blocking clauses subsumed by ones added after them (as of _pending)
+        self._pending = []          # blocking clauses added since subsumed was last updated
+        self.compacted_blocks = 0   # blocking clauses kept by the last rebuild
+
+        self._solver = self._make_solver()
 
-        self._solver = minisolvers.MinisatSolver()
+    def _make_solver(self):
+        solver = minisolvers.MinisatSolver()
 
         # Initialize random seed and randomize variable activity if seed is given
-        if rand_seed is not None:
-            self._solver.set_rnd_seed(rand_seed)
-            self._solver.set_rnd_init_act(True)
+        if self.rand_seed is not None:
+            solver.set_rnd_seed(self.rand_seed)
+            solver.set_rnd_init_act(True)
 
-        while self._solver.nvars() < self.n:
-            self._solver.new_var(self.bias)
+        while solver.nvars() < self.n:
+            solver.new_var(self.bias)
 
         if self.bias is None:
-            self._solver.set_rnd_pol(True)
+            solver.set_rnd_pol(True)
+
+        return solver
+
+    def compact(self):
+        """Replace the solver with a fresh one containing only the live
+        blocking clauses: dead temporary clauses and their activation
+        variables are dropped, as is any blocking clause subsumed by one
+        added after it.  This requires the index of blocking clauses."""
+        with self.stats.time('map.compact'):
+            old_vars = self._solver.nvars()
+            # (counted here rather than with the solver's nclauses(), which
+            # leaves out clauses the solver has simplified away)
+            old_clauses = len(self.blocks) + self.dead_vars
+
+            clauses = sorted(self.blocks, key=len)
+            self.blocks = utils.SetTrie()
+            self._solver = self._make_solver()
+            dropped_literals = 0
+            for clause in clauses:
+                if not self.blocks.has_subset(clause):
+                    self.blocks.add(clause)
+                    self._solver.add_clause(clause)
+                else:
+                    dropped_literals += len(clause)
+            self.dead_vars = 0
+            self.subsumed = 0
+            self._pending = []
+            self.compacted_blocks = len(self.blocks)
+            self.invalidate_implies()
+
+            self.stats.increment_counter('map.compact.vars_reclaimed', old_vars - self._solver.nvars())
+            self.stats.increment_counter('map.compact.clauses_reclaimed', old_clauses - len(self.blocks))
+            self.stats.increment_counter('map.index.clauses', len(self.blocks) - len(clauses))
+            self.stats.increment_counter('map.index.literals', -dropped_literals)
+
+    def set_bias(self, bias):
+        """Change the bias (as in the constructor).  Variable polarities are
+        fixed when the variables are created, so this rebuilds the solver
+        (see compact()), which requires the index of blocking clauses; it
+        must not be called while temporary clauses are in use."""
+        if bias != self.bias:
+            self.bias = bias
+            self.compact()
+
+    def add_blocking_clause(self, clause):
+        added = super(MinisatMapSolver, self).add_blocking_clause(clause)
+        if added and self.compact_threshold:
+            # (what it subsumes is counted when needed, in _should_compact())
+            self._pending.append(clause)
+        return added
+
+    def _should_compact(self):
+        if not self.compact_threshold:
+            return False
+        nblocks = len(self.blocks)
+        if nblocks >= self.compact_threshold and nblocks >= 2 * self.compacted_blocks:
+            return True
+        if self.dead_vars + self.subsumed >= self.compact_threshold:
+            return True
+        if not self._pending or self.dead_vars + nblocks - 1 < self.compact_threshold:
+            # (too few blocking clauses for enough of them to be subsumed)
+            return False
+        for clause in self._pending:
+            # (the count includes the clause itself)
+            self.subsumed += self.blocks.count_supersets(clause) - 1
+        self._pending = []
+        return self.dead_vars + self.subsumed >= self.compact_threshold
 
     def next_seed(self):
+        self.add_received()
+        if self._should_compact():
+            self.compact()
         if self._solver.solve():
             return self.get_seed()
         else:
             return None
+
+
+class ExploredIndex(object):
+    """An in-memory index of the MUSes and MSSes found so far, answering
+    whether a seed is already explored (i.e., blocked in a Map formula
+    containing exactly their blocking clauses) without a solver.
+
+    Exact repeats are found by hashing each result's canonical (sorted)
+    form.  Otherwise, a seed is explored iff it is a superset of a known
+    MUS or a subset of a known MSS, checked with one trie of MUSes and one
+    of MCSes (complements of MSSes: seed is a subset of an MSS iff the
+    seed's complement contains its MCS).
+
+    Seeds found explored are counted in stats as 'index.exact' (repeats)
+    or 'index.covered'.
+    """
+    def __init__(self, n, stats):
+        self.n = n
+        self.stats = stats
+        self._seen = set()
+        self._muses = utils.SetTrie()
+        self._mcses = utils.SetTrie()
+
+    def check_seed(self, seed):
+        """Check whether a given seed is still unexplored (as
+        MapSolver.check_seed()).
+
+        Returns:
+            True if seed is unexplored, False if it is already covered.
+        """
+        if tuple(sorted(seed)) in self._seen:
+            self.stats.increment_counter('index.exact')
+            return False
+        if self._muses.has_subset(seed) or \
+                (len(self._mcses) and self._mcses.has_subset(utils.BitSet(self.n, seed).complement())):
+            self.stats.increment_counter('index.covered')
+            return False
+        return True
+
+    def block_down(self, frompoint):
+        self._seen.add(tuple(sorted(frompoint)))
+        self._mcses.add(utils.BitSet(self.n, frompoint).complement())
+
+    def block_up(self, frompoint):
+        self._seen.add(tuple(sorted(frompoint)))
+        self._muses.add(frompoint)
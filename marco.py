@@ -3,18 +3,34 @@
 import argparse
 import atexit
 import copy
+import itertools
 import multiprocessing
 import os
 import select
+import shutil
 import signal
 import sys
+import tempfile
 import threading
+import time
 
 import utils
+import checkpoint
+import distributed
 import mapsolvers
+import resultbus
 import CNFsolvers
+import cnfinstance
 from MCSEnumerator import MCSEnumerator
-from MarcoPolo import MarcoPolo
+from MarcoPolo import MarcoPolo, find_critical
+
+
+def address(text):
+    # HOST:PORT, for --listen and --connect
+    host, sep, port = text.rpartition(':')
+    if not sep or not port.isdigit():
+        raise argparse.ArgumentTypeError("expected HOST:PORT, got '%s'" % text)
+    return (host, int(port))
 
 
 def parse_args():
@@ -34,9 +50,21 @@ def parse_args():
                         help="limit the runtime to TIMEOUT seconds")
     parser.add_argument('-l', '--limit', type=int, default=None,
                         help="limit number of subsets output (counting both MCSes and MUSes)")
+    parser.add_argument('--cache-dir', type=str, default=None,
+                        help="keep a binary copy of each parsed CNF/GCNF instance in CACHE_DIR (keyed by a hash of the input's contents) and load it from there in later runs instead of parsing the input again.")
+    parser.add_argument('--checkpoint', type=str, default=None, metavar='FILE',
+                        help="record every result in FILE as it is found (synced to disk every --checkpoint-interval seconds), so that an interrupted run can be continued with --resume.")
+    parser.add_argument('--checkpoint-interval', type=float, default=60, metavar='SECONDS',
+                        help="maximum time between syncs of the checkpoint file to disk [default: 60]")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue the run recorded in the --checkpoint file (if it exists): results already recorded are blocked without being output again, and the bias, --nomax, --map-solver, and --rnd-init settings of the original run are used.")
+    parser.add_argument('--collapse-duplicates', action='store_true',
+                        help="merge syntactically identical soft constraints (CNF/GCNF only) into one before enumerating, expanding each result back over the original constraints when it is output.")
+    parser.add_argument('--prepass', action='store_true',
+                        help="before enumerating, find the constraints in every MUS (reporting the MSS complementing each, i.e., each singleton MCS, right away) and, for CNF/GCNF, drop the constraints outside the lean kernel (found via autarkies), which are in no MUS and every MSS.")
     type_group = parser.add_mutually_exclusive_group()
     type_group.add_argument('--cnf', action='store_true',
-                            help="assume input is in DIMACS CNF or Group CNF format (autodetected if filename is *.[g]cnf or *.[g]cnf.gz).")
+                            help="assume input is in DIMACS CNF or Group CNF format, optionally gzip, bzip2, or xz compressed (autodetected if filename is *.[g]cnf or *.[g]cnf.{gz,bz2,xz}).")
     type_group.add_argument('--smt', action='store_true',
                             help="assume input is in SMT2 format (autodetected if filename is *.smt2).")
     parser.add_argument('-b', '--bias', type=str, choices=['MUSes', 'MCSes'], default='MUSes',
@@ -54,6 +82,17 @@ def parse_args():
                            help="use same seeds for all children (still randomized but with all seeds of value 1.")
     par_group.add_argument('--all-randomized', action='store_true',
                            help="randomly initialize *all* children in parallel mode (default: first thread is *not* randomly initialized, all others are).")
+    par_group.add_argument('--result-bus', type=int, nargs='?', const=64, default=None, metavar='MB',
+                           help="share results between children through a ring buffer of MB megabytes [default: 64] in shared memory, which they write and read directly, instead of having the master forward every result to every child.")
+    par_group.add_argument('--adaptive', type=float, nargs='?', const=2.0, default=None, metavar='SECONDS',
+                           help="every SECONDS [default: 2], compare the rates of new (non-duplicate) results of the MUS- and MCS-biased children, and switch a child from the less productive bias to the other (keeping at least one child with each bias, and trying both if all children have the same one).")
+    net_group = par_group.add_mutually_exclusive_group()
+    net_group.add_argument('--listen', type=address, default=None, metavar='HOST:PORT',
+                           help="coordinate a distributed run: accept remote workers (see --connect) on the given address (port 0 picks a free port, which is printed), in place of or in addition to the children of --parallel.")
+    net_group.add_argument('--connect', type=address, default=None, metavar='HOST:PORT',
+                           help="run as a remote worker for the coordinator at the given address (see --listen), with the bias and solver options given here; the input file must be the coordinator's (or a copy of it).")
+    par_group.add_argument('--authkey', type=str, default=None,
+                           help="the key shared by a coordinator and its workers (required with --listen or --connect).")
     comms_group = par_group.add_mutually_exclusive_group()
     comms_group.add_argument('--comms-disable', action='store_true',
                              help="disable the communications between children (i.e., when the master receives a result from a child, it won't send to other children).")
@@ -68,6 +107,20 @@ def parse_args():
                            help="only used if *not* using --parallel: initialize variable activity in solvers to random values (optionally specify a random seed [default: 1 if --rnd-init specified without a seed]).")
     exp_group.add_argument('--improved-implies', action='store_true',
                            help="use improved technique for Map formula implications (implications under assumptions) [default: False, use only singleton MCSes as hard constraints]")
+    exp_group.add_argument('--model-rotation', action='store_true',
+                           help="in the Minisat-based shrink() (--force-minisat or --improved-implies), use the model from each satisfiable check to find further necessary constraints via recursive model rotation, saving solver calls.")
+    exp_group.add_argument('--shrink-strategy', type=str, choices=['deletion', 'qx'], default='deletion',
+                           help="strategy for shrink() in the Minisat- and Z3-based solvers: 'deletion' tests one constraint at a time; 'qx' uses QuickXplain-style divide and conquer (for CNF, implies the Minisat-based solver unless --improved-implies is given; not compatible with --native-shrink or --pmuser) [default: deletion]")
+    exp_group.add_argument('--grow-strategy', type=str, choices=['linear', 'progression'], default='linear',
+                           help="strategy for grow(): 'linear' tests one constraint at a time; 'progression' adds constraints in blocks of doubling size, bisecting blocks that cannot be added [default: linear]")
+    exp_group.add_argument('--lattice-cache', type=int, default=None, metavar='SIZE',
+                           help="answer subset checks from a cache of up to SIZE known unsatisfiable subsets (unsat cores) and SIZE known satisfiable subsets where possible, instead of calling the solver (any superset of an unsat core is unsatisfiable; any subset of a satisfiable subset is satisfiable).")
+    exp_group.add_argument('--map-solver', type=str, choices=['minisat', 'minicard'], default='minisat',
+                           help="solver for the Map formula: 'minisat' finds maximal (MUS bias) or minimal (MCS bias) seeds via variable polarities; 'minicard' finds maximum- or minimum-cardinality seeds via a cardinality constraint (not compatible with --nomax) [default: minisat]")
+    exp_group.add_argument('--map-index', action='store_true',
+                           help="keep an index of the blocking clauses added to the Map solver, to skip duplicate and subsumed ones (and, with --map-solver minicard, to check seeds without the solver).  Every blocking clause is kept in the index, so it can take far more memory than the Map solver itself; --stats reports its size.  Implied by --map-compact and --adaptive.")
+    exp_group.add_argument('--map-compact', type=int, default=None, metavar='N',
+                           help="rebuild the Map solver from its live blocking clauses whenever N clauses can be dropped (temporary clauses whose activation variables are dead, and blocking clauses subsumed by later ones) and whenever the blocking clauses have doubled in number (to at least N) since the last rebuild (not compatible with --map-solver minicard).")
     exp_group.add_argument('--dump-map', nargs='?', type=argparse.FileType('w'),
                            help="dump clauses added to the Map formula to the given file.")
     solver_group = exp_group.add_mutually_exclusive_group()
@@ -75,6 +128,8 @@ def parse_args():
                               help="use Minisat in place of MUSer2 for CNF (NOTE: much slower and usually not worth doing!)")
     solver_group.add_argument('--pmuser', type=int, default=None,
                               help="use MUSer2-para in place of MUSer2 to run in parallel (specify # of threads.)")
+    solver_group.add_argument('--native-shrink', action='store_true',
+                              help="extract MUSes with the MUS extractor built into pyminisolvers (deletion, clause-set refinement, and model rotation in C++) in place of MUSer2 (no external binary needed).")
     exp_group.add_argument('--nomax', action='store_true',
                            help="perform no model maximization whatsoever (applies either shrink() or grow() to all seeds)")
 
@@ -97,6 +152,69 @@ def parse_args():
         sys.stderr.write("SMT cannot be read from STDIN.  Please specify a filename.\n")
         sys.exit(1)
 
+    if args.map_solver == 'minicard' and args.nomax:
+        sys.stderr.write("--map-solver minicard cannot be used with --nomax.\n")
+        sys.exit(1)
+
+    if args.map_solver == 'minicard' and args.map_compact:
+        sys.stderr.write("--map-compact cannot be used with --map-solver minicard.\n")
+        sys.exit(1)
+
+    if args.shrink_strategy == 'qx' and (args.native_shrink or args.pmuser is not None):
+        sys.stderr.write("--shrink-strategy qx cannot be used with --native-shrink or --pmuser.\n")
+        sys.exit(1)
+
+    # (model rotation is only done by the Minisat-based deletion shrink(), for CNF)
+    rotates = (args.force_minisat or args.improved_implies) and not (args.native_shrink or args.pmuser is not None or args.mcs_only) and args.shrink_strategy == 'deletion'
+    if args.model_rotation and not (rotates and is_cnf_input(args)):
+        sys.stderr.write("--model-rotation requires CNF input and --force-minisat or --improved-implies, and cannot be used with --native-shrink, --pmuser, --mcs-only, or --shrink-strategy qx.\n")
+        sys.exit(1)
+
+    if args.resume and not args.checkpoint:
+        sys.stderr.write("--resume requires --checkpoint.\n")
+        sys.exit(1)
+
+    if args.checkpoint and args.mcs_only:
+        sys.stderr.write("--checkpoint cannot be used with --mcs-only.\n")
+        sys.exit(1)
+
+    if args.adaptive is not None and (args.map_solver == 'minicard' or args.nomax):
+        sys.stderr.write("--adaptive cannot be used with --map-solver minicard or --nomax.\n")
+        sys.exit(1)
+
+    if (args.listen or args.connect) and not args.authkey:
+        sys.stderr.write("--listen and --connect require --authkey.\n")
+        sys.exit(1)
+
+    if args.connect and (args.parallel or args.checkpoint):
+        sys.stderr.write("--connect cannot be used with --parallel or --checkpoint.\n")
+        sys.exit(1)
+
+    if (args.listen or args.connect) and args.infile == sys.stdin:
+        sys.stderr.write("--listen and --connect cannot be used with input from STDIN.  Please specify a filename.\n")
+        sys.exit(1)
+
+    if args.listen and (args.result_bus or args.adaptive is not None):
+        sys.stderr.write("--listen cannot be used with --result-bus or --adaptive.\n")
+        sys.exit(1)
+
+    if args.collapse_duplicates and args.smt:
+        sys.stderr.write("--collapse-duplicates is only supported for CNF/GCNF input.\n")
+        sys.exit(1)
+
+    # a CNF instance loaded once up front (in parallel mode) and shared by all children
+    args.instance = None
+    # the map back to the original constraints, if duplicates are collapsed
+    args.reduction = None
+    # the shared result bus (--result-bus) and this process's index in it
+    args.bus = None
+    args.child_id = None
+    # the MSSes of the critical constraints (--prepass), found once by the
+    # master in parallel / distributed mode
+    args.critical = None
+    # the hash of the input, once computed (see hash_input())
+    args.input_hash = None
+
     return args
 
 
@@ -165,25 +283,156 @@ def setup_execution(args, stats, mainpid):
         atexit.register(at_exit, stats)
 
 
+def is_cnf_input(args):
+    name = args.infile.name
+    for ext in ('.gz', '.bz2', '.xz'):
+        if name.endswith(ext):
+            name = name[:-len(ext)]
+    return args.cnf or name.endswith('.cnf') or name.endswith('.gcnf')
+
+
+def setup_instance(args):
+    # parse (or map from the cache) the CNF instance, then reduce it if requested
+    instance = cnfinstance.load(args.infile, args.cache_dir, args.input_hash)
+    if args.prepass or args.collapse_duplicates:
+        always = []
+        if args.prepass:
+            always = CNFsolvers.autark_constraints(instance)
+            if len(always) == instance.n:
+                always = []   # satisfiable: leave the single MSS to be found
+        dropped = set(always)
+        constraints = [g for g in range(1, instance.n+1) if g not in dropped]
+        if args.collapse_duplicates:
+            classes = cnfinstance.duplicate_classes(instance, constraints)
+        else:
+            classes = [[g] for g in constraints]
+        instance, args.reduction = cnfinstance.reduce_instance(instance, classes, always)
+    return instance
+
+
+def critical_results(args, stats):
+    # the MSS complementing each singleton MCS (--prepass), for the master
+    # to report and every child to block before enumerating
+    csolver = setup_csolver(args, seed=None)
+    with stats.time('prepass'):
+        critical = find_critical(csolver)
+    stats.increment_counter("prepass.critical", len(critical))
+    return [('S', [x for x in range(1, csolver.n + 1) if x != c]) for c in critical]
+
+
+# options that determine the Map solver, kept in a checkpoint so that a
+# resumed run rebuilds the same one
+CHECKPOINT_SETTINGS = ['bias', 'nomax', 'map_solver', 'rnd_init', 'collapse_duplicates', 'prepass']
+
+
+# settings that determine the numbering of the constraints, which the
+# coordinator and workers of a distributed run must share
+DISTRIBUTED_SETTINGS = ['collapse_duplicates', 'prepass']
+
+
+def hash_input(args):
+    # a hash of the input, or None if it cannot be read twice (e.g., a pipe);
+    # kept in args, so the input is only hashed once (see setup_instance())
+    if args.input_hash is None:
+        try:
+            args.input_hash = cnfinstance.content_hash(args.infile)
+        except (IOError, OSError, ValueError):
+            return None
+    return args.input_hash
+
+
+def setup_checkpoint(args):
+    # open the checkpoint log, replacing settings in args with the original
+    # run's when resuming
+    input_hash = hash_input(args)   # (None: not checked on resume)
+    settings = dict((key, getattr(args, key)) for key in CHECKPOINT_SETTINGS)
+    settings['input'] = input_hash
+
+    try:
+        log = checkpoint.CheckpointLog(args.checkpoint, settings, args.checkpoint_interval, args.resume)
+    except (IOError, OSError, ValueError) as e:
+        error_exit("Unable to open checkpoint file.", "Check the --checkpoint path, or run without --resume to start a new checkpoint.", e)
+
+    if None not in (input_hash, log.settings['input']) and input_hash != log.settings['input']:
+        sys.stderr.write("Checkpoint %s was recorded for a different input.\n" % args.checkpoint)
+        sys.exit(1)
+    for key in CHECKPOINT_SETTINGS:
+        setattr(args, key, log.settings[key])
+
+    atexit.register(log.close)
+    return log
+
+
+def resumed_results(log, n):
+    # the results recorded in a checkpoint, checked against the instance
+    for _, subset in log.results:
+        if any(x < 1 or x > n for x in subset):
+            sys.stderr.write("Checkpoint %s does not match the input (constraint index out of range).\n" % log.path)
+            sys.exit(1)
+    return log.results
+
+
+def distributed_settings(args):
+    # what a coordinator and a worker check that they share
+    settings = dict((key, getattr(args, key)) for key in DISTRIBUTED_SETTINGS)
+    settings['input'] = hash_input(args)
+    if settings['input'] is None:
+        sys.stderr.write("Unable to read %s to check it against the coordinator's or workers' input.\n" % args.infile.name)
+        sys.exit(1)
+    return settings
+
+
+def setup_hub(args):
+    # listen for remote workers (--listen); they are accepted once the hub
+    # is started
+    try:
+        hub = distributed.Hub(args.listen, args.authkey.encode('utf-8'), distributed_settings(args))
+    except (IOError, OSError) as e:
+        error_exit("Unable to listen for workers.", "Check the --listen address.", e)
+    sys.stderr.write("Listening for workers on %s:%d.\n" % hub.address)
+    return hub
+
+
+def setup_worker(args):
+    # join a coordinator as a remote worker (--connect)
+    try:
+        return distributed.connect(args.connect, args.authkey.encode('utf-8'), distributed_settings(args))
+    except (IOError, OSError, EOFError) as e:
+        error_exit("Unable to connect to the coordinator.", "Check the --connect address, and that the coordinator is running.", e)
+    except (distributed.AuthenticationError, ValueError) as e:
+        error_exit("The coordinator refused the connection.", "Use the coordinator's input, --authkey, --collapse-duplicates, and --prepass.", e)
+
+
 def setup_csolver(args, seed):
     infile = args.infile
 
     # create appropriate constraint solver
-    if args.cnf or infile.name.endswith('.cnf') or infile.name.endswith('.cnf.gz') or infile.name.endswith('.gcnf') or infile.name.endswith('.gcnf.gz'):
+    if is_cnf_input(args):
         if args.force_minisat or args.mcs_only:  # mcs_only doesn't care about fancy features, give it a plain MinisatSubsetSolver
             solverclass = CNFsolvers.MinisatSubsetSolver
+        elif args.native_shrink:
+            solverclass = CNFsolvers.NativeShrinkSubsetSolver
         elif args.improved_implies:
             solverclass = CNFsolvers.ImprovedImpliesSubsetSolver
+        elif args.shrink_strategy == 'qx':
+            solverclass = CNFsolvers.MinisatSubsetSolver
         else:
             solverclass = CNFsolvers.MUSerSubsetSolver
 
+        if args.instance is not None:
+            instance = args.instance
+        else:
+            instance = setup_instance(args)
+
         try:
             if args.mcs_only:
-                csolver = solverclass(infile, seed, store_dimacs=True)
+                csolver = solverclass(instance, seed, store_dimacs=True)
             elif args.pmuser is not None:
-                csolver = solverclass(infile, seed, numthreads=args.pmuser)
+                csolver = solverclass(instance, seed, numthreads=args.pmuser)
+            elif args.model_rotation:
+                csolver = solverclass(instance, seed, rotate=True)
             else:
-                csolver = solverclass(infile, seed)
+                csolver = solverclass(instance, seed)
         except utils.ExecutableException as e:
             error_exit("Unable to use MUSer2 for MUS extraction.", "Use --force-minisat to use Minisat instead (NOTE: it will be much slower.)", e)
         except (IOError, OSError) as e:
@@ -216,18 +465,25 @@ def setup_msolver(n, args, seed=None):
         varbias = (args.bias == 'MUSes')  # High bias (True) for MUSes, low (False) for MCSes
 
     try:
-        msolverclass = mapsolvers.MinisatMapSolver
-        if args.parallel:
-            # Synchronize if running in parallel mode
+        if args.map_solver == 'minicard':
+            msolverclass = mapsolvers.MinicardMapSolver
+            kwargs = {}
+        else:
+            msolverclass = mapsolvers.MinisatMapSolver
+            kwargs = {'compact': args.map_compact}
+        # (switching the bias with --adaptive rebuilds the solver from the index)
+        kwargs['index'] = args.map_index or args.adaptive is not None
+        if args.parallel or args.connect:
+            # Synchronize if running in parallel mode (or as a remote worker)
             msolverclass = utils.synchronize_class(msolverclass)
-        msolver = msolverclass(n, bias=varbias, rand_seed=seed, dump=args.dump_map)
+        msolver = msolverclass(n, bias=varbias, rand_seed=seed, dump=args.dump_map, **kwargs)
     except OSError as e:
         error_exit("Unable to load pyminisolvers library.", "Run 'make -C pyminisolvers' to compile the library.", e)
 
     return msolver
 
 
-def setup_solvers(args, seed=None):
+def setup_solvers(args, seed=None, stats=None):
     csolver = setup_csolver(args, seed)
     msolver = setup_msolver(csolver.n, args, seed)
 
@@ -235,6 +491,15 @@ def setup_solvers(args, seed=None):
         csolver.set_msolver(msolver)
     except AttributeError:
         pass
+    if stats is not None:
+        msolver.set_stats(stats)
+    try:
+        csolver.set_stats(stats)
+        csolver.set_strategies(args.shrink_strategy, args.grow_strategy)
+        if args.lattice_cache:
+            csolver.set_cache(utils.LatticeCache(args.lattice_cache))
+    except AttributeError:
+        pass
 
     return (csolver, msolver)
 
@@ -248,33 +513,61 @@ def setup_config(args):
     else:
         config['maximize'] = True
     config['verbose'] = args.verbose > 1
+    config['prepass'] = args.prepass
 
     return config
 
 
-def run_enumerator(stats, args, seed=None, pipe=None):
-    csolver, msolver = setup_solvers(args, seed)
+def run_enumerator(stats, args, seed=None, pipe=None, log=None):
+    csolver, msolver = setup_solvers(args, seed, stats)
     config = setup_config(args)
+    if pipe is not None:
+        # a child or worker: the master ran the prepass (see critical_results())
+        config['prepass'] = False
 
     if args.mcs_only:
         enumerator = MCSEnumerator(csolver, stats, config, pipe)
     else:
         enumerator = MarcoPolo(csolver, msolver, stats, config, pipe)
 
+    if log is not None:
+        with stats.time('resume'):
+            enumerator.replay(resumed_results(log, csolver.n))
+    if args.critical and not args.mcs_only:
+        enumerator.replay(args.critical)
+
+    if args.bus is not None and not args.comms_disable:
+        reader = resultbus.BusReader(args.bus, args.child_id, stats)
+        if args.comms_ignore:
+            # read the results, but do not use them
+            def feed():
+                reader()
+                return []
+        else:
+            feed = reader
+        if args.mcs_only:
+            enumerator.set_feed(feed)
+        else:
+            msolver.set_feed(feed)
+
     # enumerate results in a separate thread so signal handling works while in C code
     # ref: https://thisismiller.github.io/blog/CPython-Signal-Handling/
     def enumerate():
-        remaining = args.limit
+        remaining = [args.limit]
+        if log is not None and log.partial is not None:
+            # finish the output of the result the last run was stopped in
+            result, printed = log.partial
+            if output_result(result, args, stats, csolver.n, remaining, log, skip=printed):
+                sys.stderr.write("Result limit reached.\n")
+                return
         for result in enumerator.enumerate():
-            if pipe:
+            if args.bus is not None:
+                args.bus.publish(result, args.child_id)
+            elif pipe:
                 pipe.send(result)
-            else:
-                print_result(result, args, stats, csolver.n)
-                if remaining:
-                    remaining -= 1
-                    if remaining == 0:
-                        sys.stderr.write("Result limit reached.\n")
-                        return
+            elif output_result(result, args, stats, csolver.n, remaining, log):
+                sys.stderr.write("Result limit reached.\n")
+                return
 
     enumthread = threading.Thread(target=enumerate)
     enumthread.daemon = True  # required so signal handler exit will end enumeration thread
@@ -288,22 +581,235 @@ def run_enumerator(stats, args, seed=None, pipe=None):
         enumthread.join(float('inf'))
 
 
-def run_master(stats, args, pipes):
+class AdaptiveScheduler(object):
+    """Switches the bias of parallel children (--adaptive) according to
+    their recent productivity.
+
+    The master records each result a child sends as new or duplicate.
+    After every interval, the children with each bias are compared by the
+    number of new results per child in that interval, and if one bias did
+    less than half as well as the other, its least productive child is
+    switched to the other bias.  At least one child is kept with each bias,
+    so both are still measured; if all children start with the same bias,
+    the least productive one is switched to the other after the first
+    interval.
+    """
+    def __init__(self, modes, interval, stats, verbose=False):
+        # only MUS and MCS children (MarcoPolo instances) can switch
+        self.biases = {}
+        for child, mode in enumerate(modes):
+            if mode in ('MUS', 'MCS'):
+                self.biases[child] = mode + 'es'
+        self.interval = interval
+        self.stats = stats
+        self.verbose = verbose
+        self._start_window()
+
+    def _start_window(self):
+        self.start = time.time()
+        self.new = dict((child, 0) for child in self.biases)
+        self.duplicates = dict((child, 0) for child in self.biases)
+
+    def remove(self, child):
+        """Stop scheduling a child that has finished (or exited)."""
+        self.biases.pop(child, None)
+
+    def record(self, child, is_new):
+        if child not in self.biases:
+            return
+        if is_new:
+            self.new[child] += 1
+        else:
+            self.duplicates[child] += 1
+
+    def timeout(self):
+        """Seconds until the end of the current interval."""
+        return max(0.0, self.start + self.interval - time.time())
+
+    def update(self):
+        """End the current interval if it is over.
+
+        Returns:
+            A list of (child, bias) switches to make.
+        """
+        elapsed = time.time() - self.start
+        if elapsed < self.interval:
+            return []
+
+        if self.verbose:
+            for child in sorted(self.biases):
+                new = self.new[child]
+                sys.stderr.write("Child %d (%s): %.1f new results/s, %d duplicates, %s s/result\n" % (
+                    child, self.biases[child], new / elapsed, self.duplicates[child],
+                    "%.3f" % (elapsed / new) if new else "-"))
+
+        switches = []
+        groups = {'MUSes': [], 'MCSes': []}
+        for child in sorted(self.biases):
+            groups[self.biases[child]].append(child)
+        # new results per child for each bias
+        rates = dict((bias, float(sum(self.new[c] for c in group)) / len(group))
+                     for bias, group in groups.items() if group)
+
+        if len(rates) == 2:
+            worse, better = sorted(rates, key=rates.get)
+            if rates[worse] * 2 < rates[better] and len(groups[worse]) > 1:
+                child = min(groups[worse], key=lambda c: (self.new[c], -self.duplicates[c]))
+                switches.append((child, better))
+        elif len(self.biases) > 1:
+            # try the other bias, so it can be measured
+            child = min(self.biases, key=lambda c: (self.new[c], -self.duplicates[c]))
+            other = 'MCSes' if self.biases[child] == 'MUSes' else 'MUSes'
+            switches.append((child, other))
+
+        for child, bias in switches:
+            self.biases[child] = bias
+            self.stats.increment_counter("adaptive.switch")
+            if self.verbose:
+                sys.stderr.write("Switching child %d to %s.\n" % (child, bias))
+        self._start_window()
+        return switches
+
+
+def run_master(stats, args, pipes, log=None, bus=None, hub=None):
     # for filtering duplicate results (found near-simultaneously by 2+ children)
     # and spurious results (if using improved-implies and a child reaches a point that
     # suddenly becomes blocked by new blocking clauses, it could return that incorrectly
     # as an MUS or MCS)
-    # Need to parse the constraint set (again!) just to get n for the map formula...
-    csolver = setup_csolver(args, seed=None)
-    msolver = mapsolvers.MinisatMapSolver(csolver.n)
+    if args.instance is not None:
+        n = args.instance.n
+    else:
+        # Need to parse the constraint set (again!) just to get n for the explored index...
+        n = setup_csolver(args, seed=None).n
+    explored = mapsolvers.ExploredIndex(n, stats)
     # Old way: results = set()
 
-    remaining = args.limit
+    # every result so far, for workers joining later (with --listen)
+    found = []
 
-    while multiprocessing.active_children() and pipes:
-        ready, _, _ = select.select(pipes, [], [])
+    if log is not None:
+        # results from the checkpoint are not output again, just blocked
+        # here and in every child
+        with stats.time('resume'):
+            for result in resumed_results(log, n):
+                if result[0] == 'U':
+                    explored.block_up(result[1])
+                else:
+                    explored.block_down(result[1])
+                for pipe in pipes:
+                    pipe.send(result)
+                if hub is not None:
+                    found.append(result)
+
+    children = list(pipes)   # (indexed as args.parallel; pipes shrinks as children finish)
+    adaptive = None
+    if args.adaptive is not None:
+        adaptive = AdaptiveScheduler(args.parallel.split(','), args.adaptive, stats, args.verbose > 1)
+
+    remaining = [args.limit]   # (in a list, to be updated within report())
+
+    if log is not None and log.partial is not None:
+        # finish the output of the result the last run was stopped in
+        result, printed = log.partial
+        if output_result(result, args, stats, n, remaining, log, skip=printed):
+            sys.stderr.write("Result limit reached.\n")
+            for pipe in pipes:
+                pipe.send('terminate')
+            sys.exit(0)
+
+    def report(result, sender):
+        # filter out duplicate / spurious results and output the rest,
+        # returning whether the result was new
+        with stats.time('msolver'):
+            if not explored.check_seed(result[1]):
+                if args.verbose > 1:
+                    print("Child (%s) sent duplicate (len: %d)" % (sender, len(result[1])))
+                if result[0] == 'U':
+                    stats.increment_counter("duplicate MUS")
+                else:
+                    stats.increment_counter("duplicate MSS")
+                if adaptive is not None and sender is not None:
+                    adaptive.record(sender, False)
+
+                # already found/reported/explored
+                return False
+
+        if adaptive is not None and sender is not None:
+            adaptive.record(sender, True)
+
+        with stats.time('msolver_block'):
+            if result[0] == 'U':
+                explored.block_up(result[1])
+            elif result[0] == 'S':
+                explored.block_down(result[1])
+        if hub is not None:
+            found.append(result)
+
+        # Old way to check duplicates:
+        #res_set = frozenset(result[1])
+        #res_set = ",".join(str(x) for x in result[1])
+        #if res_set in results:
+        #    continue
+
+        #results.add(res_set)
+
+        if output_result(result, args, stats, n, remaining, log):
+            sys.stderr.write("Result limit reached.\n")
+            # End / cleanup all children
+            for pipe in pipes:
+                pipe.send('terminate')
+            # Exit main process
+            sys.exit(0)
+        return True
+
+    for result in args.critical or []:
+        # (found before the children started, and blocked in each of them)
+        if explored.check_seed(result[1]):   # (not resumed from the checkpoint)
+            report(result, None)
+
+    def collect_bus():
+        # results published by children on the result bus (which they also
+        # read directly, so they are not forwarded)
+        for sender, result in bus.collect():
+            report(result, sender)
+
+    # (with --listen, keep waiting for workers to join until every worker
+    # has finished its work)
+    finished = False   # whether any child or worker has sent 'done'
+    while (multiprocessing.active_children() and pipes) or (hub is not None and (pipes or not finished)):
+        timeout = adaptive.timeout() if adaptive is not None else None
+        if bus is not None:
+            ready, _, _ = select.select(pipes + [bus], [], [], timeout)
+        elif hub is not None:
+            ready, _, _ = select.select(pipes + [hub], [], [], timeout)
+        else:
+            ready, _, _ = select.select(pipes, [], [], timeout)
+        if adaptive is not None:
+            for child, bias in adaptive.update():
+                try:
+                    children[child].send(('bias', bias))
+                except (IOError, OSError):
+                    # the child has already exited (its 'done' or EOF is
+                    # read below)
+                    adaptive.remove(child)
         with stats.time('hubcomms'):
             for receiver in ready:
+                if receiver is bus:
+                    collect_bus()
+                    continue
+                if receiver is hub:
+                    for worker in hub.joined():
+                        if args.verbose > 1:
+                            print("Worker joined.")
+                        stats.increment_counter("worker.joined")
+                        if not args.comms_disable:
+                            # bring it up to date, as if it had received every result so far
+                            for result in found:
+                                worker.send(result)
+                        pipes.append(worker)
+                        children.append(worker)
+                    continue
+
                 while receiver.poll():
                     try:
                         # get a result
@@ -312,6 +818,8 @@ def run_master(stats, args, pipes):
                         # Sometimes a closed pipe will still trigger ready and .poll(),
                         # but it then throws an EOFError on .recv().  Handle that here.
                         pipes.remove(receiver)
+                        if adaptive is not None:
+                            adaptive.remove(children.index(receiver))
                         break
 
                     if result[0] == 'done':
@@ -320,10 +828,16 @@ def run_master(stats, args, pipes):
                         # enumerating MCSes, e.g.)
                         if args.verbose > 1:
                             print("Child (%s) sent 'done'." % receiver)
+                        finished = True
                         # Terminate the child process.
                         receiver.send('terminate')
-                        # Remove it from the list of active pipes
+                        # Remove it from the list of active pipes (and stop
+                        # reading from it: it may close at any point now)
                         pipes.remove(receiver)
+                        if adaptive is not None:
+                            # (no more bias requests for it)
+                            adaptive.remove(children.index(receiver))
+                        break
 
                     elif result[0] == 'complete':
                         # "complete" indicates the child process has completed enumeration,
@@ -336,6 +850,10 @@ def run_master(stats, args, pipes):
                         #    # Print received stats
                         #    at_exit(result[1])
 
+                        if bus is not None:
+                            # the child published all of its results before this
+                            collect_bus()
+
                         # End / cleanup all children
                         for pipe in pipes:
                             pipe.send('terminate')
@@ -344,56 +862,65 @@ def run_master(stats, args, pipes):
 
                     else:
                         assert result[0] in ['U', 'S']
-                        # filter out duplicate / spurious results
-                        with stats.time('msolver'):
-                            if not msolver.check_seed(result[1]):
-                                if args.verbose > 1:
-                                    print("Child (%s) sent duplicate (len: %d)" % (receiver, len(result[1])))
-                                if result[0] == 'U':
-                                    stats.increment_counter("duplicate MUS")
-                                else:
-                                    stats.increment_counter("duplicate MSS")
-
-                                # already found/reported/explored
-                                continue
-
-                        with stats.time('msolver_block'):
-                            if result[0] == 'U':
-                                msolver.block_up(result[1])
-                            elif result[0] == 'S':
-                                msolver.block_down(result[1])
-
-                        # Old way to check duplicates:
-                        #res_set = frozenset(result[1])
-                        #res_set = ",".join(str(x) for x in result[1])
-                        #if res_set in results:
-                        #    continue
-
-                        #results.add(res_set)
-
-                        print_result(result, args, stats, csolver.n)
-
-                        if remaining:
-                            remaining -= 1
-                            if remaining == 0:
-                                sys.stderr.write("Result limit reached.\n")
-                                # End / cleanup all children
-                                for pipe in pipes:
-                                    pipe.send('terminate')
-                                # Exit main process
-                                sys.exit(0)
-
-                        if not args.comms_disable:
+                        if report(result, children.index(receiver)) and not args.comms_disable:
                             # send it to all children *other* than the one we got it from
                             for other in pipes:
                                 if other != receiver:
                                     other.send(result)
 
+    if bus is not None:
+        collect_bus()
+
+
+def expand_result(result, args):
+    # the result(s) over the original constraints for a result from the solvers
+    if args.reduction is None:
+        return [result]
+    return args.reduction.expand(result)
+
+
+def num_constraints(args, n):
+    # the number of original constraints, given the number the solvers see
+    if args.reduction is None:
+        return n
+    return args.reduction.n
+
+
+def output_result(result, args, stats, n, remaining, log, skip=0):
+    # Print the output(s) for a result (after the first skip, already output
+    # by a resumed run), counting them against the result limit (remaining,
+    # a one-element list: the number left, or None), and record it in the
+    # checkpoint, noting how many outputs were printed if the limit cut them
+    # short.  Returns whether the limit was reached.
+    outputs = itertools.islice(expand_result(result, args), skip, None)
+    printed = skip
+    for output in outputs:
+        print_result(output, args, stats, num_constraints(args, n))
+        printed += 1
+        if remaining[0]:
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                break
+    reached = bool(args.limit) and remaining[0] == 0
+    if log is not None:
+        # flush the output first, so every result in the checkpoint has been output
+        sys.stdout.flush()
+        if not skip:
+            log.append(result)
+        if reached and next(outputs, None) is not None:
+            log.mark_partial(printed)
+        elif skip:
+            log.mark_partial(None)
+        if reached:
+            # exiting: make sure everything recorded is on disk
+            log.sync()
+    return reached
+
 
 def print_result(result, args, stats, num_constraints):
     if result[0] == 'S' and args.print_mcses:
         # MCS = the complement of the MSS relative to the full set of constraints
-        result = ('C', set(range(1, num_constraints+1)).difference(result[1]))
+        result = ('C', utils.BitSet(num_constraints, result[1]).complement())
     output = result[0]
     if args.alltimes:
         output = "%s %0.3f" % (output, stats.total_time())
@@ -416,12 +943,43 @@ def main():
     with stats.time('setup'):
         args = parse_args()
         setup_execution(args, stats, os.getpid())
-        if args.same_seeds or args.comms_disable:
+        if args.same_seeds or args.result_bus or args.adaptive is not None:
             assert args.parallel is not None, "some flags you have specified have to be tested in the parallel mode."
+        if args.comms_disable:
+            assert args.parallel is not None or args.listen is not None, "some flags you have specified have to be tested in the parallel mode."
+
+        log = None
+        if args.checkpoint:
+            log = setup_checkpoint(args)
+
+        hub = None
+        if args.listen:
+            hub = setup_hub(args)
+        conn = None
+        if args.connect:
+            conn = setup_worker(args)
+
+        if (args.parallel or hub is not None) and is_cnf_input(args):
+            # Parse the instance just once, here, into a binary file that
+            # the master and all children map (rather than each parsing the
+            # input separately, and the master more than once).
+            if args.cache_dir is None:
+                args.cache_dir = tempfile.mkdtemp(prefix='marco')
+                atexit.register(shutil.rmtree, args.cache_dir, True)
+            args.instance = setup_instance(args)
+
+        if args.prepass and (args.parallel or hub is not None):
+            # find the critical constraints once, rather than in every child
+            args.critical = critical_results(args, stats)
+
+        if args.parallel and args.result_bus:
+            # created before the children, which share its memory
+            args.bus = resultbus.ResultBus(args.result_bus << 20)
 
         if args.parallel:
             for i, mode in enumerate(args.parallel.split(',')):
                 newargs = copy.copy(args)
+                newargs.child_id = i
                 if mode == 'MUS':
                     newargs.bias = 'MUSes'
                 elif mode == 'MCS':
@@ -454,13 +1012,15 @@ def main():
         sys.stderr.write("Result limit reached.\n")
         sys.exit(0)
 
-    if args.parallel:
+    if args.parallel or hub is not None:
         for proc in procs:
             proc.start()
-        run_master(stats, args, pipes)
+        if hub is not None:
+            hub.start()
+        run_master(stats, args, pipes, log, args.bus, hub)
 
     else:
-        run_enumerator(stats, args, seed=args.rnd_init)
+        run_enumerator(stats, args, seed=args.rnd_init, pipe=conn, log=log)
 
 
 if __name__ == '__main__':
@@ -12,12 +12,35 @@ inline int Littoi(Lit l) {
     return (var(l)+1) * (sign(l) ? -1 : 1);
 }
 
+#include "musextractor.h"
+
+// Access to protected members of a Solver
+struct SolverAccess : public Solver {
+    static const vec<Lit>& get_trail(Solver* s) { return s->*(&SolverAccess::trail); }
+
+    // releases a variable that is already assigned (which
+    // Solver::releaseVar() skips)
+    static void release(Solver* s, Var v) {
+        (s->*(&SolverAccess::released_vars)).push(v);
+    }
+
+    // makes sure the next simplify() runs in full if any variables are
+    // waiting to be released (it otherwise may skip that work)
+    static void flush_released(Solver* s) {
+        if ((s->*(&SolverAccess::released_vars)).size() > 0) {
+            s->*(&SolverAccess::simpDB_assigns) = -1;
+            s->*(&SolverAccess::simpDB_props) = 0;
+        }
+    }
+};
+
 extern "C" {
     Solver* Solver_new() { return new Solver(); }
     void Solver_delete(Solver* s) { delete s; }
 
     int nVars(Solver* s) { return s->nVars(); }
     int nClauses(Solver* s) { return s->nClauses(); }
+    int nAssigns(Solver* s) { return s->nAssigns(); }
 
     // Controls the level of phase saving (0=none, 1=limited, 2=full).
     void setPhaseSaving(Solver* s, int ps) { s->phase_saving = ps; }
@@ -46,6 +69,61 @@ extern "C" {
         return s->addClause(itoLit(lit));
     }
 
+    // adds the unit clause lit, and frees its variable for reuse by a later
+    // newVar() (once the solver next simplifies)
+    // returns false if the variable cannot be reused (lit is already false)
+    bool releaseVar(Solver* s, int lit) {
+        Lit l = itoLit(lit);
+        if (s->value(l) == l_Undef) {
+            s->releaseVar(l);
+            return true;
+        }
+        else if (s->value(l) == l_True) {
+            // already true at level 0 (e.g., from a learnt unit clause)
+            SolverAccess::release(s, var(l));
+            return true;
+        }
+        return false;
+    }
+
+    // adds a whole block of clauses in one call
+    // lits holds every clause's literals, each clause terminated by a 0,
+    // and groups holds one group id per clause: group 0 clauses are added
+    // as-is (hard), and any other group g is instrumented with the
+    // relaxation variable nv+g (as in add_clause_instrumented, index g-1).
+    // returns -1 if the input refers to a variable not yet created or the
+    // clause and group counts do not match, otherwise 1 if the solver is
+    // still consistent and 0 if a conflict was found.
+    int addClauses(Solver* s, int len, int* lits, int nclauses, int* groups, int nv) {
+        int n = s->nVars();
+        int count = 0;
+        for (int i = 0 ; i < len ; i++) {
+            if (lits[i] > n || -lits[i] > n) return -1;
+            if (lits[i] == 0) count++;
+        }
+        if (count != nclauses) return -1;
+        for (int i = 0 ; i < nclauses ; i++) {
+            if (groups[i] < 0 || nv + groups[i] > n) return -1;
+        }
+
+        vec<Lit> clause;
+        int c = 0;
+        for (int i = 0 ; i < len ; i++) {
+            if (lits[i] == 0) {
+                if (groups[c] > 0) {
+                    clause.push( ~mkLit(nv + groups[c] - 1) );
+                }
+                s->addClause(clause);
+                clause.clear();
+                c++;
+            }
+            else {
+                clause.push( itoLit(lits[i]) );
+            }
+        }
+        return s->okay();
+    }
+
     bool solve(Solver* s) { return s->solve(); }
     bool solve_assumptions(Solver* s, int len, int* lits) {
         vec<Lit> assumptions;
@@ -71,7 +149,11 @@ extern "C" {
         return s->solve(assumptions);
     }
 
-    bool simplify(Solver* s) { return s->simplify(); }
+    // (also frees any released variables for reuse, removing them from the trail)
+    bool simplify(Solver* s) {
+        SolverAccess::flush_released(s);
+        return s->simplify();
+    }
 
     // This is fairly slow to call from Python.
     // It is better to copy the whole model over with fillModel()
@@ -121,6 +203,19 @@ extern "C" {
         return len;
     }
 
+    // fills an array with the current assignments (the trail) from index
+    // start up to (not including) end: between solves, the literals
+    // assigned at level 0, in the order they were assigned
+    // returns the number of elements filled
+    int getTrail(Solver* s, int* assigns, int start, int end) {
+        const vec<Lit>& trail = SolverAccess::get_trail(s);
+        if (end > trail.size()) end = trail.size();
+        for (int i = start ; i < end ; i++) {
+            assigns[i-start] = Littoi(trail[i]);
+        }
+        return (end > start) ? end - start : 0;
+    }
+
     // fills an array w/ any literals known to be implied by the current formula
     // and any given assumptions (i.e., all 0-level assignments)
     // returns number of elements in the filled array
@@ -73,6 +73,7 @@ class Solver(object):
 
         l.nVars.argtypes = [c_void_p]
         l.nClauses.argtypes = [c_void_p]
+        l.nAssigns.argtypes = [c_void_p]
         l.setPhaseSaving.argtypes = [c_void_p, c_int]
         l.setRndPol.argtypes = [c_void_p, c_bool]
         l.setRndInitAct.argtypes = [c_void_p, c_bool]
@@ -84,6 +85,10 @@ class Solver(object):
         l.addClause.argtypes = [c_void_p, c_int, c_void_p]
         l.addUnit.restype = c_bool
         l.addUnit.argtypes = [c_void_p, c_int]
+        l.releaseVar.restype = c_bool
+        l.releaseVar.argtypes = [c_void_p, c_int]
+        l.addClauses.restype = c_int
+        l.addClauses.argtypes = [c_void_p, c_int, c_void_p, c_int, c_void_p, c_int]
 
         l.solve.restype = c_bool
         l.solve.argtypes = [c_void_p]
@@ -108,6 +113,16 @@ class Solver(object):
         l.getImplies.restype = c_int
         l.getImplies_assumptions.argtypes = [c_void_p, c_void_p, c_void_p, c_int]
         l.getImplies_assumptions.restype = c_int
+        l.getTrail.argtypes = [c_void_p, c_void_p, c_int, c_int]
+        l.getTrail.restype = c_int
+
+        l.MUSExtractor_new.restype = c_void_p
+        l.MUSExtractor_new.argtypes = [c_int]
+        l.MUSExtractor_delete.argtypes = [c_void_p]
+        l.MUSExtractor_addClauses.restype = c_int
+        l.MUSExtractor_addClauses.argtypes = [c_void_p, c_int, c_void_p, c_int, c_void_p]
+        l.MUSExtractor_shrink.restype = c_int
+        l.MUSExtractor_shrink.argtypes = [c_void_p, c_void_p, c_void_p, c_int, c_void_p, c_int, c_bool, c_void_p, c_void_p]
 
     def __del__(self):  # type: () -> None
         """Delete the Solver object"""
@@ -115,15 +130,22 @@ class Solver(object):
 
     @staticmethod
     def _to_intptr(a):  # type: (array.array) -> Tuple[int, int]
-        """Helper function to get a ctypes POINTER(c_int) for an array"""
+        """Helper function to get a ctypes POINTER(c_int) for an array
+        (or for a writable memoryview of C ints, without copying it)"""
+        if isinstance(a, memoryview):
+            buf = (c_int * len(a)).from_buffer(a)
+            return ctypes.cast(buf, ctypes.POINTER(c_int)), len(a)
         addr, size = a.buffer_info()
         return ctypes.cast(addr, ctypes.POINTER(c_int)), size
 
     @staticmethod
     def _get_array(seq):  # type: (Iterable[int]) -> array.array
-        """Helper function to turn any iterable into an array (unless it already is one)"""
+        """Helper function to turn any iterable into an array (unless it
+        already is one, or is a writable memoryview of C ints)"""
         if isinstance(seq, array.array):
             return seq
+        elif isinstance(seq, memoryview) and seq.format == 'i' and not seq.readonly:
+            return seq
         else:
             return array.array('i', seq)
 
@@ -161,6 +183,11 @@ class Solver(object):
         '''Get the number of clauses or constraints added to the solver.'''
         return self.lib.nClauses(self.s)
 
+    def nassigns(self):  # type: () -> int
+        '''Get the number of variables currently assigned (between calls to
+        `solve()`, the number of level-0 assignments).'''
+        return self.lib.nAssigns(self.s)
+
     def set_phase_saving(self, ps):  # type: (int) -> None
         '''Set the level of phase saving (0=none, 1=limited, 2=full (default)).'''
         self.lib.setPhaseSaving(self.s, ps)
@@ -192,7 +219,8 @@ class Solver(object):
             A boolean value returned from MiniSat's ``addClause()`` function,
             indicating success (True) or conflict (False).
         """
-        if not all(abs(x) <= self.nvars() for x in lits):
+        nvars = self.nvars()
+        if not all(abs(x) <= nvars for x in lits):
             raise Exception("Not all variables in %s are created yet.  Call new_var() first." % lits)
         if len(lits) > 1:
             a = self._get_array(lits)
@@ -204,6 +232,42 @@ class Solver(object):
         else:
             return self.lib.addClause(self.s, 0, None)
 
+    def add_temp_clause(self, lits):  # type: (Sequence[int]) -> int
+        """Add a temporary clause, guarded by a new activation literal: the
+        clause is only enforced when the activation literal is included in
+        the assumptions given to `solve()`, and it is removed permanently
+        by `remove_temp_clause()`.
+
+        Args:
+            lits:
+              A sequence of literals specified as in `add_clause()`.
+
+        Returns:
+            The activation literal (a positive integer).
+        """
+        act = self.new_var() + 1
+        clause = array.array('i', [-act])
+        clause.extend(lits)
+        self.add_clause(clause)
+        return act
+
+    def remove_temp_clause(self, act):  # type: (int) -> bool
+        """Remove a temporary clause added by `add_temp_clause()`.
+
+        With MiniSat, the activation literal's variable is recycled by a
+        later `new_var()` (including in `add_temp_clause()`), so repeatedly
+        adding and removing temporary clauses does not grow the number of
+        variables.  Minicard cannot recycle variables, so there the
+        variable is simply left unused.
+
+        Args:
+            act: The clause's activation literal.
+
+        Returns:
+            True if the variable will be recycled, False otherwise.
+        """
+        return self.lib.releaseVar(self.s, -act)
+
     def check_complete(self, positive_lits=None, negative_lits=None):  # type: (Sequence[int], Sequence[int]) -> bool
         """Check whether a given complete assignment satisfies the current set
         of clauses.  For efficiency, it may be given just the positive literals
@@ -329,11 +393,45 @@ class Solver(object):
         # reduce the array down to just the valid indexes
         return res[:count]
 
+    def implies_since(self, start=0):  # type: (int) -> array.array
+        """Get literals known to be implied by the current formula (as in
+        `implies()` without assumptions), skipping the first start of them.
+
+        The solver first propagates any new level-0 implications (via
+        `simplify()`).  After that, level-0 implications are only ever
+        appended to, so a caller can keep the earlier results and fetch
+        just the new ones.  The exception is variables freed by
+        `remove_temp_clause()`, which the solver drops from the list.
+
+        Args:
+            start: The number of implications already known to the caller.
+
+        Returns:
+            An array of the new implied literals, or None if the formula
+            is unsatisfiable.
+        """
+        if not self.simplify():
+            return None
+        end = self.nassigns()
+        res = array.array('i', [0] * max(end-start, 0))
+        res_ptr, _ = self._to_intptr(res)
+        count = self.lib.getTrail(self.s, res_ptr, start, end)
+        return res[:count]
+
 
 class SubsetMixin(Solver):
     """A mixin for any Solver class that lets it reason about subsets of a clause set."""
     _origvars = None    # type: int
     _relvars = None     # type: int
+    _clause_blocks = None   # blocks given to add_clauses_grouped(), for shrink()
+    _extractor = None   # MUS extractor in the library, created by the first shrink()
+    shrink_stats = None     # type: Tuple[int, int]
+
+    def __del__(self):  # type: () -> None
+        """Delete the MUS extractor, if any, and the Solver object"""
+        if self._extractor is not None:
+            self.lib.MUSExtractor_delete(self._extractor)
+        super(SubsetMixin, self).__del__()
 
     def set_varcounts(self, vars, constraints):  # type: (int, int) -> None
         """Record how many of the solver's variables and clauses are
@@ -361,6 +459,107 @@ class SubsetMixin(Solver):
         instrumented_clause.extend(lits)
         self.add_clause(instrumented_clause)
 
+    def add_clauses_grouped(self, lits, groups):  # type: (Sequence[int], Sequence[int]) -> bool
+        """Add a block of clauses in a single call into the solver library.
+        This is much faster than calling `add_clause()` or
+        `add_clause_instrumented()` for each clause when loading a large
+        instance.
+
+        Args:
+            lits:
+                A flat sequence containing the literals of every clause
+                (specified as in `add_clause()`), with each clause terminated
+                by a 0.
+            groups:
+                A sequence with one group id per clause.  Clauses in group 0
+                are added as "hard" clauses (as with `add_clause()`), while a
+                clause in any other group g is added as a "soft" clause with
+                index g-1 (as with `add_clause_instrumented()`).
+
+        Returns:
+            True if the solver is still consistent after adding the clauses,
+            False if a conflict was detected.
+        """
+        if self._origvars is None:
+            raise Exception("SubsetSolver.set_varcounts() must be called before .add_clauses_grouped()")
+        a = self._get_array(lits)
+        a_ptr, size = self._to_intptr(a)
+        g = self._get_array(groups)
+        g_ptr, g_size = self._to_intptr(g)
+        ret = self.lib.addClauses(self.s, size, a_ptr, g_size, g_ptr, self._origvars)
+        if ret < 0:
+            raise Exception("Invalid clause block: every clause must be 0-terminated with one group per clause, and all variables (including relaxation variables) must be created first.  Call new_var() first.")
+
+        # remembered (not copied) for shrink()
+        if self._clause_blocks is None:
+            self._clause_blocks = []
+        self._clause_blocks.append((a, g))
+        if self._extractor is not None:
+            if self.lib.MUSExtractor_addClauses(self._extractor, size, a_ptr, g_size, g_ptr) < 0:
+                # rebuilt (and the error reported) by the next shrink()
+                self.lib.MUSExtractor_delete(self._extractor)
+                self._extractor = None
+
+        return bool(ret)
+
+    def shrink(self, subset, hard=(), offset=0, rotate=True):  # type: (Sequence[int], Sequence[int], int, bool) -> array.array
+        """Shrink an unsatisfiable subset of the soft constraints to a MUS
+        (minimal unsatisfiable subset), entirely within the solver library.
+
+        Extraction is deletion-based, with clause-set refinement (dropping
+        all constraints outside the unsat core after each UNSAT check) and,
+        optionally, recursive model rotation (using each SAT check's model
+        to find further necessary constraints without calling the solver).
+        It uses the clauses given to `add_clauses_grouped()`; model rotation
+        is only correct if no other clauses over the original variables have
+        been added to the solver.
+
+        Args:
+            subset:
+                A sequence of the indexes of the soft constraints to shrink
+                (which must be unsatisfiable together).
+            hard:
+                An optional sequence of indexes of soft constraints known to
+                be in the MUS; these are always included and never checked.
+            offset (int):
+                Optional offset of the indexes in subset and hard (and in the
+                returned MUS) relative to the zero-based indexes in MiniSat.
+            rotate (bool):
+                Whether to use model rotation.
+
+        Returns:
+            An array of constraint indexes comprising a MUS.  Afterwards,
+            shrink_stats holds a tuple of the number of solver calls made and
+            the number of constraints found necessary by model rotation
+            (i.e., solver calls saved).
+        """
+        if self._origvars is None or self._clause_blocks is None:
+            raise Exception("SubsetSolver.add_clauses_grouped() must be called before .shrink()")
+        seed = array.array('i', [i-offset for i in subset])
+        forced = array.array('i', [i-offset for i in hard])
+        if not all(0 <= i < self._relvars for i in seed) or not all(0 <= i < self._relvars for i in forced):
+            raise Exception("Constraint indexes given to shrink() must refer to soft constraints.")
+
+        if self._extractor is None:
+            self._extractor = self.lib.MUSExtractor_new(self._origvars)
+            for a, g in self._clause_blocks:
+                a_ptr, size = self._to_intptr(a)
+                g_ptr, g_size = self._to_intptr(g)
+                if self.lib.MUSExtractor_addClauses(self._extractor, size, a_ptr, g_size, g_ptr) < 0:
+                    self.lib.MUSExtractor_delete(self._extractor)
+                    self._extractor = None
+                    raise Exception("shrink() requires the clauses given to add_clauses_grouped() to use only original (non-relaxation) variables.")
+
+        seed_ptr, seed_size = self._to_intptr(seed)
+        forced_ptr, forced_size = self._to_intptr(forced)
+        out = array.array('i', [-1] * (seed_size + forced_size))
+        out_ptr, _ = self._to_intptr(out)
+        stats = array.array('i', [0, 0])
+        stats_ptr, _ = self._to_intptr(stats)
+        count = self.lib.MUSExtractor_shrink(self._extractor, self.s, seed_ptr, seed_size, forced_ptr, forced_size, rotate, out_ptr, stats_ptr)
+        self.shrink_stats = tuple(stats)
+        return array.array('i', [i+offset for i in out[:count]])
+
     def solve_subset(self, subset, extra_assumps=None):  # type: (Sequence[int], Sequence[int]) -> bool
         """Solve a subset of the constraints containing all "hard" clauses
         (those added with the regular `add_clause()` method) and the
@@ -542,7 +741,8 @@ class MinicardSolver(Solver):
             A boolean value returned from MiniCard's ``addAtMost()``
             function, indicating success (True) or conflict (False).
         """
-        if not all(abs(x) <= self.nvars() for x in lits):
+        nvars = self.nvars()
+        if not all(abs(x) <= nvars for x in lits):
             raise Exception("Not all variables in %s are created yet.  Call new_var() first." % lits)
 
         if len(lits) > 1:
@@ -625,6 +825,37 @@ class MinisatSubsetSolver(SubsetMixin, MinisatSolver):
     >>> core = S.unsat_core()
     >>> sorted(core)
     [0, 1, 2, 3]
+
+    Many clauses can be added at once with `add_clauses_grouped()`, given a
+    flat, 0-terminated sequence of literals and a group for each clause.
+    Group 0 holds hard clauses, and group g is the soft constraint g-1.
+
+    >>> S = MinisatSubsetSolver()
+    >>> S.set_varcounts(vars = 3, constraints = 2)
+    >>> for i in range(3+2):
+    ...     _ = S.new_var()
+    >>> S.add_clauses_grouped([1, 2, 0, -1, 0, -2, 3, 0, -3, 0], [0, 1, 2, 2])
+    True
+    >>> S.solve_subset([0])
+    True
+    >>> S.solve_subset([0, 1])
+    False
+    >>> sorted(S.unsat_core())
+    [0, 1]
+
+    An unsatisfiable subset of clauses added this way can be shrunk to a
+    MUS in a single call.
+
+    >>> S = MinisatSubsetSolver()
+    >>> S.set_varcounts(vars = 2, constraints = 4)
+    >>> for i in range(2+4):
+    ...     _ = S.new_var()
+    >>> S.add_clauses_grouped([1, 0, -1, 0, 2, 0, -1, -2, 0], [1, 2, 3, 4])
+    True
+    >>> sorted(S.shrink([0, 1, 3]))
+    [0, 1]
+    >>> sorted(S.shrink([0, 2, 3]))
+    [0, 2, 3]
     """
 
     pass
@@ -675,7 +906,8 @@ class MinicardSubsetSolver(SubsetMixin, MinicardSolver):
         """
         if self._origvars is None:
             raise Exception("SubsetSolver.set_varcounts() must be called before .add_atmost_instrumented()")
-        if not all(abs(x) <= self.nvars() for x in lits):
+        nvars = self.nvars()
+        if not all(abs(x) <= nvars for x in lits):
             raise Exception("Not all variables in %s are created yet.  Call new_var() first." % lits)
         if self._origvars+1+index > self.nvars():
             raise Exception("Relaxation variable %i has not been created yet.  Call new_var() first." % (self._origvars+1+index))
@@ -0,0 +1,238 @@
+// MUS extraction over a clause-set instrumented with relaxation variables.
+//
+// Included by both minisat.cpp and minicard.cpp, after the respective
+// Solver.h, itoLit(), and 'using namespace Minisat'.
+//
+// A MUSExtractor keeps its own copy of the instrumented clauses (a flat
+// arena of 0-terminated clauses, each with a group id, as passed to
+// addClauses()) plus occurrence lists, so that it can check which groups a
+// given assignment falsifies.  Shrinking runs deletion-based extraction on
+// the Solver it is given, with clause-set refinement (dropping everything
+// outside each unsat core) and recursive model rotation (flipping single
+// variables in a witness model to find further critical groups without
+// calling the solver).
+//
+// Model rotation is only sound if every clause over the original variables
+// was given to the extractor (i.e., the solver contains no other clauses
+// over those variables).
+
+#include <vector>
+
+struct MUSExtractor {
+    int nv;                                         // number of original variables
+    std::vector<int> lits;                          // clause arena (0-terminated clauses)
+    std::vector<int> starts;                        // start of each clause in lits
+    std::vector<int> groups;                        // group of each clause (0 = hard)
+    std::vector< std::vector<int> > group_clauses;  // clauses in each group
+    std::vector< std::vector<int> > occurs;         // clauses containing each literal
+
+    explicit MUSExtractor(int nv) : nv(nv), group_clauses(1), occurs(2*nv) {}
+
+    static int litIndex(int lit) { return (lit > 0) ? 2*(lit-1) : 2*(-lit-1)+1; }
+
+    // true if every literal of clause c is false in the given assignment
+    bool falsified(int c, const std::vector<char>& val) const {
+        for (int i = starts[c] ; lits[i] != 0 ; i++) {
+            int l = lits[i];
+            if (val[(l > 0) ? l-1 : -l-1] == (l > 0)) return false;
+        }
+        return true;
+    }
+
+    bool groupFalsified(int g, const std::vector<char>& val) const {
+        const std::vector<int>& cs = group_clauses[g];
+        for (size_t i = 0 ; i < cs.size() ; i++) {
+            if (falsified(cs[i], val)) return true;
+        }
+        return false;
+    }
+};
+
+// One level of model rotation: a group g known to be critical (with the
+// current assignment as its witness), the next literal of g's clauses to
+// try flipping, and the variable flipped to reach this witness (-1 if none).
+struct RotationFrame {
+    int g;
+    int ci;
+    int li;
+    int flipped;
+};
+
+// Find further critical groups by recursive model rotation, starting from
+// a witness val for critical group g0: an assignment satisfying every
+// active group but g0.  Newly found critical groups are marked in crit.
+// Returns the number found.
+static int rotateModel(const MUSExtractor* x, std::vector<char>& val, int g0,
+                       const std::vector<char>& active, std::vector<char>& crit) {
+    int found = 0;
+    std::vector<RotationFrame> stack;
+    std::vector<int> hit;   // groups falsified after a flip
+    RotationFrame top = {g0, 0, -1, -1};
+    stack.push_back(top);
+
+    while (!stack.empty()) {
+        RotationFrame& f = stack.back();
+        const std::vector<int>& cs = x->group_clauses[f.g];
+
+        // advance to the next literal of a falsified clause of f.g
+        int var = -1;
+        while (f.ci < (int)cs.size()) {
+            int c = cs[f.ci];
+            if (f.li < 0) {
+                if (!x->falsified(c, val)) { f.ci++; continue; }
+                f.li = x->starts[c];
+            }
+            else {
+                f.li++;
+            }
+            int l = x->lits[f.li];
+            if (l == 0) { f.ci++; f.li = -1; continue; }
+            var = (l > 0) ? l-1 : -l-1;
+            break;
+        }
+        if (var < 0) {
+            if (f.flipped >= 0) val[f.flipped] = !val[f.flipped];
+            stack.pop_back();
+            continue;
+        }
+
+        // flip var: only clauses containing the literal that becomes false
+        // can become falsified
+        int nowfalse = val[var] ? var+1 : -(var+1);
+        val[var] = !val[var];
+        hit.clear();
+        bool hard = false;
+        const std::vector<int>& occ = x->occurs[MUSExtractor::litIndex(nowfalse)];
+        for (size_t i = 0 ; i < occ.size() && !hard && hit.size() < 2 ; i++) {
+            int c = occ[i];
+            int g = x->groups[c];
+            if (g > 0 && !active[g-1]) continue;
+            if (!x->falsified(c, val)) continue;
+            if (g == 0) hard = true;
+            else if (hit.empty() || hit[0] != g) hit.push_back(g);
+        }
+        if (!hard && hit.size() == 1 && hit[0] != f.g && !x->groupFalsified(f.g, val)) {
+            int g = hit[0];
+            if (!crit[g-1]) {
+                // val is now a witness for g
+                crit[g-1] = true;
+                found++;
+                RotationFrame next = {g, 0, -1, var};
+                stack.push_back(next);
+                continue;
+            }
+        }
+        val[var] = !val[var];
+    }
+    return found;
+}
+
+extern "C" {
+    MUSExtractor* MUSExtractor_new(int nv) { return new MUSExtractor(nv); }
+    void MUSExtractor_delete(MUSExtractor* x) { delete x; }
+
+    // adds a block of clauses, in the same format as addClauses()
+    // returns -1 if the input refers to a variable beyond the extractor's
+    // original variables or the clause and group counts do not match, 1 otherwise.
+    int MUSExtractor_addClauses(MUSExtractor* x, int len, int* lits, int nclauses, int* groups) {
+        int count = 0;
+        for (int i = 0 ; i < len ; i++) {
+            if (lits[i] > x->nv || -lits[i] > x->nv) return -1;
+            if (lits[i] == 0) count++;
+        }
+        if (count != nclauses) return -1;
+        for (int i = 0 ; i < nclauses ; i++) {
+            if (groups[i] < 0) return -1;
+        }
+
+        int c = x->groups.size();   // index of the next clause
+        bool start = true;
+        for (int i = 0 ; i < len ; i++) {
+            if (start) {
+                x->starts.push_back(x->lits.size());
+                start = false;
+            }
+            x->lits.push_back(lits[i]);
+            if (lits[i] == 0) {
+                c++;
+                start = true;
+            }
+            else {
+                x->occurs[MUSExtractor::litIndex(lits[i])].push_back(c);
+            }
+        }
+        for (int i = 0 ; i < nclauses ; i++) {
+            int g = groups[i];
+            if ((int)x->group_clauses.size() <= g) x->group_clauses.resize(g+1);
+            x->group_clauses[g].push_back(x->groups.size());
+            x->groups.push_back(g);
+        }
+        return 1;
+    }
+
+    // shrinks seed (0-based soft constraint indexes) to a MUS, treating the
+    // constraints in hard as always included (and necessary)
+    // out must have room for len+hlen elements; the MUS is written there,
+    // and its size returned.
+    // stats[0] gets the number of solver calls and stats[1] the number of
+    // critical constraints found by model rotation (i.e., calls saved).
+    int MUSExtractor_shrink(MUSExtractor* x, Solver* s, int* seed, int len, int* hard, int hlen, bool rotate, int* out, int* stats) {
+        int n = (int)x->group_clauses.size() - 1;
+        for (int i = 0 ; i < len ; i++) {
+            if (seed[i]+1 > n) n = seed[i]+1;
+        }
+        for (int i = 0 ; i < hlen ; i++) {
+            if (hard[i]+1 > n) n = hard[i]+1;
+        }
+        if ((int)x->group_clauses.size() < n+1) x->group_clauses.resize(n+1);
+
+        std::vector<char> active(n, false);   // current candidate set
+        std::vector<char> crit(n, false);     // known to be in the MUS
+        for (int i = 0 ; i < len ; i++) active[seed[i]] = true;
+        for (int i = 0 ; i < hlen ; i++) active[hard[i]] = crit[hard[i]] = true;
+
+        std::vector<char> val(x->nv);
+        vec<Lit> assumps;
+        stats[0] = stats[1] = 0;
+
+        for (int i = 0 ; i < len ; i++) {
+            int c = seed[i];
+            if (!active[c] || crit[c]) continue;
+
+            assumps.clear();
+            for (int j = 0 ; j < n ; j++) {
+                if (active[j] && j != c) assumps.push( itoLit(x->nv + j + 1) );
+            }
+            stats[0]++;
+            if (!s->solve(assumps)) {
+                // keep only the core (plus the hard constraints)
+                for (int j = 0 ; j < n ; j++) active[j] = crit[j];
+                for (int j = 0 ; j < s->conflict.size() ; j++) {
+                    active[var(s->conflict[j]) - x->nv] = true;
+                }
+            }
+            else {
+                crit[c] = true;
+                if (rotate) {
+                    for (int v = 0 ; v < x->nv ; v++) val[v] = (s->model[v] == l_True);
+                    stats[1] += rotateModel(x, val, c+1, active, crit);
+                }
+            }
+        }
+
+        int count = 0;
+        for (int i = 0 ; i < len ; i++) {
+            if (active[seed[i]]) {
+                out[count++] = seed[i];
+                active[seed[i]] = false;   // in case of duplicates
+            }
+        }
+        for (int i = 0 ; i < hlen ; i++) {
+            if (active[hard[i]]) {
+                out[count++] = hard[i];
+                active[hard[i]] = false;
+            }
+        }
+        return count;
+    }
+}
@@ -60,6 +60,33 @@ class MinisatTest(unittest.TestCase):
         implications = self.solver.implies([5])
         self.assertEqual(set(implications), set([1,-2,5,4,6]))
 
+    def test_implies_since(self):
+        self.add_subset(self.clauses[:3])
+        first = self.solver.implies_since()
+        self.assertEqual(set(first), set([1,-2]))
+        self.solver.add_clause([-3])
+        self.solver.add_clause([-1, 5])
+        new = self.solver.implies_since(len(first))
+        self.assertEqual(set(first + new), set(self.solver.implies()))
+        self.assertEqual(set(new), set([-3,4,5]))
+
+    def test_temp_clause(self):
+        self.add_subset(self.clauses[:-1])
+        act = self.solver.add_temp_clause([-6])
+        self.assertEqual(self.solver.solve([act]), False)
+        self.assertEqual(self.solver.solve(), True)
+        self.assertEqual(self.solver.remove_temp_clause(act), True)
+        self.assertEqual(self.solver.solve(), True)
+
+    def test_temp_clause_recycled(self):
+        self.add_subset(self.clauses[:-1])
+        for i in range(100):
+            act = self.solver.add_temp_clause([-5, -6])
+            self.assertEqual(self.solver.solve([act, 5]), False)
+            self.solver.remove_temp_clause(act)
+        self.assertEqual(self.solver.solve([5]), True)
+        self.assertTrue(self.solver.nvars() < self.numvars + 10)   # reused, not 100 new vars
+
 
 class MinisatSubsetTest(unittest.TestCase):
     def setUp(self):
@@ -90,6 +117,96 @@ class MinisatSubsetTest(unittest.TestCase):
         for i in range(1, self.n):
             self.assertEqual(self.solver.solve_subset(range(self.n-i)), True)
 
+    def make_bulk_solver(self):
+        bulk = minisolvers.MinisatSubsetSolver()
+        bulk.set_varcounts(self.numvars, self.n)
+        for i in range(self.numvars + self.n):
+            bulk.new_var()
+        lits = []
+        groups = []
+        for cl in self.group:
+            lits.extend(cl + [0])
+            groups.append(1)
+        for i, cl in enumerate(self.clauses):
+            lits.extend(cl + [0])
+            groups.append(i+2)
+        bulk.add_clauses_grouped(lits, groups)
+        return bulk
+
+    def test_add_clauses_grouped(self):
+        import itertools
+        bulk = self.make_bulk_solver()
+        for size in range(self.n+1):
+            for subset in itertools.combinations(range(self.n), size):
+                self.assertEqual(bulk.solve_subset(subset), self.solver.solve_subset(subset))
+
+    def test_add_clauses_grouped_hard(self):
+        bulk = self.make_bulk_solver()
+        self.assertEqual(bulk.solve_subset([1]), True)
+        bulk.add_clauses_grouped([-1, 0], [0])
+        self.assertEqual(bulk.solve_subset([1]), False)
+
+    def test_add_clauses_grouped_invalid(self):
+        bulk = self.make_bulk_solver()
+        # variable not created yet
+        self.assertRaises(Exception, bulk.add_clauses_grouped, [1, self.numvars+self.n+1, 0], [0])
+        # relaxation variable not created yet
+        self.assertRaises(Exception, bulk.add_clauses_grouped, [1, 0], [self.n+1])
+        # clause / group count mismatch
+        self.assertRaises(Exception, bulk.add_clauses_grouped, [1, 0, 2, 0], [1])
+
+    def assertMUS(self, solver, mus, hard=()):
+        self.assertEqual(solver.solve_subset(mus), False)
+        for i in mus:
+            if i not in hard:
+                self.assertEqual(solver.solve_subset([j for j in mus if j != i]), True)
+
+    def test_shrink(self):
+        for rotate in (True, False):
+            bulk = self.make_bulk_solver()
+            mus = bulk.shrink(range(self.n), rotate=rotate)
+            self.assertMUS(bulk, mus)
+            self.assertEqual(bulk.shrink_stats[0] + bulk.shrink_stats[1] >= len(mus), True)
+            self.assertEqual(sorted(bulk.shrink(range(1, self.n+1), offset=1)), [i+1 for i in sorted(mus)])
+
+    def test_shrink_hard(self):
+        bulk = self.make_bulk_solver()
+        # every constraint in hard is kept, even if not needed
+        mus = bulk.shrink(range(self.n), hard=[0])
+        self.assertEqual(0 in mus, True)
+        self.assertMUS(bulk, mus, hard=[0])
+
+    def test_shrink_random(self):
+        import random
+        rnd = random.Random(1)
+        for _ in range(20):
+            nvars = 8
+            n = 40
+            solver = minisolvers.MinisatSubsetSolver()
+            solver.set_varcounts(nvars, n)
+            for i in range(nvars + n):
+                solver.new_var()
+            lits = []
+            groups = []
+            for g in range(n+1):
+                # group 0 (hard) and a few multi-clause groups
+                for _ in range(rnd.choice([1, 1, 2]) if g > 0 else 2):
+                    lits.extend([rnd.choice([-1, 1]) * v for v in rnd.sample(range(1, nvars+1), 3)] + [0])
+                    groups.append(g)
+            solver.add_clauses_grouped(lits, groups)
+            if solver.solve_subset(range(n)):
+                continue
+            for rotate in (True, False):
+                seed = list(range(n))
+                rnd.shuffle(seed)
+                mus = solver.shrink(seed, rotate=rotate)
+                self.assertMUS(solver, mus)
+
+    def test_shrink_invalid(self):
+        bulk = self.make_bulk_solver()
+        self.assertRaises(Exception, bulk.shrink, [self.n])
+        self.assertRaises(Exception, self.solver.shrink, range(self.n))  # no add_clauses_grouped()
+
 
 class MinicardTest(unittest.TestCase):
     def setUp(self):
@@ -167,6 +284,14 @@ class MinicardTest(unittest.TestCase):
         self.int_check()
         self.assertEqual(self.solver.solve(self.assumptions), True)
 
+    def test_temp_clause(self):
+        self.make_vars()
+        self.add_subset(self.clauses[:-1])
+        act = self.solver.add_temp_clause([-8, -10])
+        self.assertEqual(self.solver.solve([act]), False)
+        self.assertEqual(self.solver.remove_temp_clause(act), False)   # not recycled
+        self.assertEqual(self.solver.solve(), True)
+
 
 class MinicardSubsetTest(unittest.TestCase):
     def setUp(self):
@@ -0,0 +1,152 @@
+"""A shared-memory log of results for parallel MARCO.
+
+Children publish each result they find into one ring buffer in an
+anonymous shared mapping (inherited by every child forked after it is
+created), and every other child reads new results from it directly, so
+the master no longer forwards each result to every child through its
+pipe.  The master reads the ring too, to filter duplicates and output the
+results; it is woken by a byte written to a notification pipe after each
+result is published.
+
+Positions in the ring are logical byte offsets that only grow (the
+physical offset is the logical one modulo the capacity).  A writer never
+overwrites results the master has not read yet, waiting for it instead,
+so the master sees every result.  Other readers may fall behind by more
+than the ring's capacity; they then skip ahead, missing some results
+(which only costs them the blocking clauses, not correctness).
+
+Ring format (native byte order):
+    header:  int64 head (end of the published records), int64 tail (end of
+             the records read by the master)
+    records: int32 kind ('U' or 'S'; 0 pads the rest of the ring before
+             wrapping around), int32 source, int32 length,
+             int32[length] constraints
+"""
+import errno
+import fcntl
+import mmap
+import multiprocessing
+import os
+import struct
+import time
+
+HEADER = struct.Struct('=qq')
+HEADER_SIZE = 64
+RECORD = struct.Struct('=iii')
+PAD = 0
+
+KINDS = {ord('U'): 'U', ord('S'): 'S'}
+
+
+class ResultBus(object):
+    """A ring of results shared by a master process and its children.  It
+    must be created before the children are started (forked)."""
+    def __init__(self, capacity):
+        self.capacity = capacity - capacity % 4
+        self._mm = mmap.mmap(-1, HEADER_SIZE + self.capacity)
+        self._lock = multiprocessing.Lock()
+        self._notify_r, self._notify_w = os.pipe()
+        for fd in (self._notify_r, self._notify_w):
+            flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+    def fileno(self):
+        """The notification pipe (readable when results have been published),
+        for select()."""
+        return self._notify_r
+
+    def publish(self, result, source):
+        """Append a result (a (kind, constraints) tuple) from a given source
+        (a child's index), waiting if the master has fallen behind by a
+        whole ring."""
+        data = RECORD.pack(ord(result[0]), source, len(result[1])) + struct.pack('=%di' % len(result[1]), *result[1])
+        size = len(data)
+        if size > self.capacity:
+            raise ValueError("Result of %d constraints does not fit in the result bus." % len(result[1]))
+
+        while True:
+            with self._lock:
+                head, tail = HEADER.unpack_from(self._mm, 0)
+                pos = head % self.capacity
+                skip = self.capacity - pos if pos + size > self.capacity else 0
+                if head + skip + size - tail <= self.capacity:
+                    if skip:
+                        struct.pack_into('=i', self._mm, HEADER_SIZE + pos, PAD)
+                        pos = 0
+                    self._mm[HEADER_SIZE + pos:HEADER_SIZE + pos + size] = data
+                    HEADER.pack_into(self._mm, 0, head + skip + size, tail)
+                    break
+            time.sleep(0.001)
+
+        try:
+            os.write(self._notify_w, b'.')
+        except OSError as e:
+            # a full pipe already has the master's attention
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+
+    def read(self, cursor, source=None):
+        """Read the results published since a position, skipping those from
+        a given source.
+
+        Returns:
+            A list of (source, result) tuples, the position after them, and
+            whether results were lost (overwritten before being read).
+        """
+        results = []
+        with self._lock:
+            head = HEADER.unpack_from(self._mm, 0)[0]
+            lost = head - cursor > self.capacity
+            if lost:
+                cursor = head
+            while cursor < head:
+                pos = cursor % self.capacity
+                kind = PAD   # (no record starts too close to the end to fit)
+                if pos + RECORD.size <= self.capacity:
+                    kind, src, length = RECORD.unpack_from(self._mm, HEADER_SIZE + pos)
+                if kind == PAD:
+                    cursor += self.capacity - pos
+                    continue
+                start = HEADER_SIZE + pos + RECORD.size
+                cursor += RECORD.size + 4 * length
+                if src != source:
+                    items = struct.unpack_from('=%di' % length, self._mm, start)
+                    results.append((src, (KINDS[kind], list(items))))
+        return results, cursor, lost
+
+    def collect(self):
+        """Read (in the master) all results published since the last call,
+        freeing their space in the ring.
+
+        Returns:
+            A list of (source, result) tuples.
+        """
+        # clear pending notifications first, so none is missed for results
+        # published from here on
+        try:
+            while os.read(self._notify_r, 4096):
+                pass
+        except OSError:
+            pass   # empty
+        tail = HEADER.unpack_from(self._mm, 0)[1]
+        results, tail, _ = self.read(tail)
+        with self._lock:
+            head = HEADER.unpack_from(self._mm, 0)[0]
+            HEADER.pack_into(self._mm, 0, head, tail)
+        return results
+
+
+class BusReader(object):
+    """A child's view of a ResultBus: calling it returns the results
+    published by other children since the last call."""
+    def __init__(self, bus, source, stats):
+        self.bus = bus
+        self.source = source
+        self.stats = stats
+        self.cursor = 0
+
+    def __call__(self):
+        results, self.cursor, lost = self.bus.read(self.cursor, self.source)
+        if lost:
+            self.stats.increment_counter("bus.lost")
+        return [result for _, result in results]
@@ -0,0 +1,88 @@
+"""Divide-and-conquer shrink() and grow() strategies.
+
+These work with any subset solver (CNF or SMT) through its
+check_subset(seed, improve_seed=True) method, testing whole blocks of
+constraints at a time rather than one constraint per solver call.
+"""
+
+
+def shrink_qx(csolver, seed, hard=()):
+    """Shrink an unsatisfiable seed to a MUS with QuickXplain (Junker, 2004).
+
+    The candidates are split in half recursively; a half is only explored
+    further if the constraints kept so far are still satisfiable without
+    it, so a MUS of size k costs O(k log(n/k)) solver calls instead of n.
+
+    Args:
+        csolver: A subset solver.
+        seed: The unsatisfiable seed (a sequence of constraint indexes).
+        hard: Constraints known to be in every MUS of the seed (kept without
+              being checked).
+
+    Returns:
+        A MUS of seed, as a list.
+    """
+    hard = set(hard)
+    background = [x for x in seed if x in hard]
+    candidates = [x for x in seed if x not in hard]
+    if not candidates:
+        return background
+    return background + _qx(csolver, background, bool(background), candidates)
+
+
+def _qx(csolver, background, check, candidates):
+    # Find a minimal subset of candidates that is unsatisfiable together
+    # with background (check=False if background alone is known to be SAT,
+    # e.g., because it is empty).
+    if check:
+        csolver.stats.increment_counter('shrink.sat_calls')
+        if not csolver.check_subset(background):
+            return []
+    if len(candidates) == 1:
+        return candidates
+    half = len(candidates) // 2
+    first, second = candidates[:half], candidates[half:]
+    found2 = _qx(csolver, background + first, True, second)
+    found1 = _qx(csolver, background + found2, bool(found2), first)
+    return found1 + found2
+
+
+def grow_progression(csolver, seed, candidates):
+    """Grow a satisfiable seed to an MSS by progression: candidates are
+    added in blocks that double in size while they keep the set satisfiable
+    and are bisected when they do not, so long runs of addable constraints
+    cost one solver call each.
+
+    When a block cannot be added and the unsat core returned by the solver
+    meets the block in only one constraint, that constraint can never be
+    added, and it is dropped directly.
+
+    Args:
+        csolver: A subset solver.
+        seed: The satisfiable seed (a sequence of constraint indexes).
+        candidates: The constraints to try adding, in order.
+
+    Returns:
+        An MSS containing seed, as a sorted list.
+    """
+    current = set(seed)
+    todo = [x for x in candidates if x not in current]
+    size = 1
+    while todo:
+        block = todo[:size]
+        is_sat, improved = csolver.check_subset(sorted(current.union(block)), improve_seed=True)
+        if is_sat:
+            # improved may include other constraints satisfied by the model
+            current.update(block)
+            current.update(improved)
+            todo = [x for x in todo[size:] if x not in current]
+            size *= 2
+        else:
+            in_block = set(block).intersection(improved)
+            if len(in_block) == 1:
+                todo.remove(in_block.pop())
+            elif size == 1:
+                todo.pop(0)
+            else:
+                size //= 2
+    return sorted(current)
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+#
+# multirun.py -- Run MARCO in scenarios that take more than one process
+#                (for the regression tests in testconfig.py)
+#
+# Usage: multirun.py MODE [MODE ARGS] [MARCO FLAGS] INFILE
+#
+# Prints the combined output of the runs, which should match that of a
+# single run of MARCO on INFILE.
+#
+
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+
+MARCO = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'marco.py')]
+
+# stderr output expected from the runs, not passed on
+EXPECTED_STDERR = ["Result limit reached."]
+
+
+# seconds a distributed run may take before it is killed
+TIMEOUT = 120
+
+
+def start_marco(args, stdin=None):
+    return subprocess.Popen(MARCO + args, stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+
+
+def marco(args, stdin=None):
+    out, err = start_marco(args, stdin).communicate()
+    report_stderr(err)
+    return out
+
+
+def report_stderr(err):
+    for line in err.splitlines():
+        if line not in EXPECTED_STDERR:
+            sys.stderr.write(line + "\n")
+
+
+def resume(limit, flags, infile):
+    # stop after limit results, then resume from the checkpoint
+    tmpdir = tempfile.mkdtemp(prefix='marcotest')
+    try:
+        checkpoint = os.path.join(tmpdir, 'checkpoint')
+        out = marco(flags + ['-l', limit, '--checkpoint', checkpoint, infile])
+        out += marco(flags + ['--checkpoint', checkpoint, '--resume', infile])
+    finally:
+        shutil.rmtree(tmpdir)
+    sys.stdout.write(out)
+
+
+def cache(flags, infile):
+    # parse into a new --cache-dir, then run again, mapping the cached copy
+    # (any difference between the runs' results fails the test)
+    tmpdir = tempfile.mkdtemp(prefix='marcotest')
+    ok = True
+    try:
+        cold = marco(flags + ['--cache-dir', tmpdir, infile])
+        if not os.listdir(tmpdir):
+            sys.stderr.write("No instance was cached in --cache-dir.\n")
+            ok = False
+        warm = marco(flags + ['--cache-dir', tmpdir, infile])
+        if not same_results(warm, cold):
+            sys.stderr.write("Output differs with a warm cache.\n")
+            ok = False
+        # (a pipe is hashed as it is parsed, rather than beforehand)
+        with open(infile, 'rb') as f:
+            piped = marco(flags + ['--cnf', '--cache-dir', tmpdir], stdin=f)
+        if not same_results(piped, cold):
+            sys.stderr.write("Output differs with a cache and input from STDIN.\n")
+            ok = False
+    finally:
+        shutil.rmtree(tmpdir)
+    sys.stdout.write(warm)
+    if not ok:
+        sys.exit(1)
+
+
+def same_results(out1, out2):
+    # (parallel runs may order the results, and the constraints within
+    # one, differently)
+    def canonical(out):
+        return sorted(" ".join(sorted(line.split())) for line in out.splitlines())
+    return canonical(out1) == canonical(out2)
+
+
+def stdin(flags, infile):
+    # read the input from STDIN (whose type cannot be told by its name)
+    with open(infile, 'rb') as f:
+        sys.stdout.write(marco(flags + ['--cnf'], stdin=f))
+
+
+def compressed(fmt, flags, infile):
+    # read a compressed copy of the input
+    import bz2
+    import gzip
+    writers = {'gz': gzip.GzipFile, 'bz2': bz2.BZ2File}
+    try:
+        import lzma
+        writers['xz'] = lzma.LZMAFile
+    except ImportError:
+        pass   # (Python 2)
+    if fmt not in writers:
+        sys.stderr.write("Cannot write %s-compressed files.\n" % fmt)
+        return
+    tmpdir = tempfile.mkdtemp(prefix='marcotest')
+    try:
+        name = os.path.basename(infile)
+        if name.endswith('.gz'):
+            name = name[:-len('.gz')]
+            f = gzip.GzipFile(infile, 'rb')
+        else:
+            f = open(infile, 'rb')
+        path = os.path.join(tmpdir, name + '.' + fmt)
+        try:
+            data = f.read()
+        finally:
+            f.close()
+        out = writers[fmt](path, 'wb')
+        try:
+            out.write(data)
+        finally:
+            out.close()
+        sys.stdout.write(marco(flags + [path]))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def distributed(modes, flags, infile):
+    # a coordinator with no local children, and a remote worker for each of
+    # the (comma-separated) parallel modes; all get the flags
+    authkey = ['--authkey', 'multirun']
+    coordinator = start_marco(flags + ['--listen', '127.0.0.1:0'] + authkey + [infile])
+    killer = threading.Timer(TIMEOUT, coordinator.kill)
+    killer.start()
+    try:
+        line = coordinator.stderr.readline()
+        address = re.match(r"Listening for workers on (.*)\.$", line.strip())
+        if address is None:
+            report_stderr(line)
+            out, err = coordinator.communicate()
+            report_stderr(err)
+            return
+
+        workers = []
+        for mode in modes.split(','):
+            modeflags = {'MUS': ['-b', 'MUSes'], 'MCS': ['-b', 'MCSes'], 'MCSonly': ['--mcs-only']}[mode]
+            workers.append(start_marco(flags + modeflags + ['--connect', address.group(1)] + authkey + [infile]))
+
+        out, err = coordinator.communicate()
+        report_stderr(err)
+        for worker in workers:
+            # (a worker's own output is not the run's)
+            _, err = worker.communicate()
+            # a worker starting after the others completed the enumeration
+            # finds the coordinator gone
+            if "Unable to connect to the coordinator." not in err:
+                report_stderr(err)
+    finally:
+        killer.cancel()
+    sys.stdout.write(out)
+
+
+def rejected(extra, flags, infile):
+    # the (space-separated) extra flags cannot be combined with the others:
+    # MARCO must refuse to run with them, and the output is that of a run
+    # without them
+    run = start_marco(flags + extra.split() + [infile])
+    out, err = run.communicate()
+    # (argparse's own usage errors exit with status 2, and an uncaught
+    # exception with status 1, but with a traceback)
+    if run.returncode != 1 or out or "Traceback" in err:
+        report_stderr(err)
+        sys.stderr.write("MARCO did not reject %s with %s.\n" % (extra, " ".join(flags)))
+        sys.exit(1)
+    sys.stdout.write(marco(flags + [infile]))
+
+
+# mode -> (function, number of mode arguments)
+MODES = {
+    'resume': (resume, 1),
+    'cache': (cache, 0),
+    'stdin': (stdin, 0),
+    'compressed': (compressed, 1),
+    'distributed': (distributed, 1),
+    'rejected': (rejected, 1),
+}
+
+
+def main():
+    if len(sys.argv) < 3 or sys.argv[1] not in MODES:
+        sys.stderr.write("Usage: %s MODE [MODE ARGS] [MARCO FLAGS] INFILE\n  MODE: one of %s\n" % (sys.argv[0], ", ".join(sorted(MODES))))
+        sys.exit(1)
+    func, nargs = MODES[sys.argv[1]]
+    modeargs = sys.argv[2:2+nargs]
+    flags = sys.argv[2+nargs:-1]
+    infile = sys.argv[-1]
+    func(*(modeargs + [flags, infile]))
+
+
+if __name__ == '__main__':
+    main()
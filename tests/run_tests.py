@@ -49,13 +49,14 @@ def makeTests(testname):
         flags_all = job.get('flags_all', [])
         exclude = job.get('exclude', [])
         out_filter = job.get('out_filter', None)
+        cmd_array = job.get('cmd_array', testconfig.cmd_array)
 
         outdir = "out/" + name + "/"
         if not os.path.exists(outdir):
             os.makedirs(outdir)
 
         for flag in flags:
-            cmdarray = testconfig.cmd_array + flags_all.split() + flag.split()
+            cmdarray = cmd_array + flags_all.split() + flag.split()
 
             for infile in files:
                 if infile in exclude:
@@ -120,7 +121,17 @@ def runTest(cmd, outfile, errfile, pid, out_filter=None):
             os.remove(tmperr)
             return 'interrupted', None
 
-    if ret > 128:
+    if ret != 0:
+        # killed by a signal, or an error (e.g., multirun.py finding that
+        # its runs disagree)
+        if mode != "nocheck" and mode != "regenerate":
+            if verbose:
+                print("\n  [37;41mTest failed (exit status %d):[0m %s" % (ret, " ".join(cmd)))
+                with open(tmperr, 'r') as f:
+                    for line in f:
+                        print("    " + line.rstrip())
+            os.remove(tmpout)
+            os.remove(tmperr)
         return 'fail', None
 
     if mode == "nocheck" or mode == "regenerate":
@@ -10,6 +10,8 @@ cmd = '../marco.py'
 cmd_array = [interpreter, cmd]
 
 common_flags = '-v'
+# for jobs that select a subset solver needing no MUSer2 (and so must not get '--force-minisat')
+native_flags = common_flags
 
 test_set_flags = [
     '', '-b MCSes', '--nomax', '--parallel MUS,MUS', '--parallel MUS,MCS', '--parallel MUS,MCSonly', '--parallel MUS,MUS --comms-disable', '--parallel MUS,MUS --comms-ignore'
@@ -30,6 +32,7 @@ reg_files = []
 reg_files.extend(glob.glob('*.cnf'))
 reg_files.extend(glob.glob('*.gcnf'))
 reg_files.extend(glob.glob('*.gz'))
+cnf_files = list(reg_files)
 # check for z3, add SMT files if available
 try:
     import z3  # noqa
@@ -40,6 +43,13 @@ except ImportError:
 
 rnd3sat_files = glob.glob('3sat_n10/*.cnf')
 
+# check for lzma (for writing xz-compressed test input)
+try:
+    import lzma  # noqa
+    lzma_available = True
+except ImportError:
+    lzma_available = False
+
 jobs = [
     # Random 3SAT
     {
@@ -66,7 +76,220 @@ jobs = [
       'exclude': ['c10.cnf', 'dlx2_aa.cnf'],
       'default': True,
     },
+    # --native-shrink
+    {
+      'name':    'marco_py',
+      'files':   reg_files,
+      'flags':   ['--native-shrink'],
+      'flags_all': native_flags,
+      'exclude': ['dlx2_aa.cnf'],
+      'default': True,
+    },
+    # --model-rotation
+    {
+      'name':    'marco_py',
+      'files':   reg_files,
+      'flags':   ['--force-minisat --model-rotation', '--improved-implies --model-rotation'],
+      'flags_all': common_flags,
+      'exclude': ['dlx2_aa.cnf'],
+      'default': True,
+    },
+    # --model-rotation with the subset solvers that do not use it
+    # (rejected; see multirun.py)
+    {
+      'name':    'marco_py',
+      'cmd_array': [interpreter, 'multirun.py', 'rejected', '--model-rotation'],
+      'files':   reg_files,
+      'flags':   ['--native-shrink', '--improved-implies --native-shrink', '--force-minisat --shrink-strategy qx'],
+      'flags_all': native_flags,
+      'exclude': ['dlx2_aa.cnf'],
+      'default': True,
+    },
+    # --shrink-strategy / --grow-strategy
+    {
+      'name':    'marco_py',
+      'files':   reg_files,
+      'flags':   ['--shrink-strategy qx', '--grow-strategy progression', '--improved-implies --shrink-strategy qx --grow-strategy progression'],
+      'flags_all': common_flags,
+      'exclude': ['dlx2_aa.cnf'],
+      'default': True,
+    },
+    # --shrink-strategy qx with the subset solvers that do not use it
+    # (rejected; see multirun.py)
+    {
+      'name':    'marco_py',
+      'cmd_array': [interpreter, 'multirun.py', 'rejected', '--pmuser 2'],
+      'files':   reg_files,
+      'flags':   ['--shrink-strategy qx', '--shrink-strategy qx --improved-implies'],
+      'flags_all': native_flags,
+      'exclude': ['dlx2_aa.cnf'],
+      'default': True,
+    },
+    {
+      'name':    'marco_py',
+      'cmd_array': [interpreter, 'multirun.py', 'rejected', '--shrink-strategy qx'],
+      'files':   reg_files,
+      'flags':   ['--native-shrink'],
+      'flags_all': native_flags,
+      'exclude': ['dlx2_aa.cnf'],
+      'default': True,
+    },
+    # --lattice-cache
+    {
+      'name':    'marco_py',
+      'files':   reg_files,
+      'flags':   ['--force-minisat --lattice-cache 100', '--shrink-strategy qx --grow-strategy progression --lattice-cache 100'],
+      'flags_all': common_flags,
+      'exclude': ['dlx2_aa.cnf'],
+      'default': True,
+    },
+    # --map-index
+    {
+      'name':    'marco_py',
+      'files':   reg_files,
+      'flags':   ['--map-index', '--map-index -b MCSes', '--map-index --map-solver minicard', '--map-index --parallel MUS,MCS'],
+      'flags_all': common_flags,
+      'exclude': ['dlx2_aa.cnf'],
+      'default': True,
+    },
+    # --map-solver minicard
+    {
+      'name':    'marco_py',
+      'files':   reg_files,
+      'flags':   ['--map-solver minicard', '--map-solver minicard -b MCSes', '--map-solver minicard --parallel MUS,MCS'],
+      'flags_all': common_flags,
+      'exclude': ['dlx2_aa.cnf'],
+      'default': True,
+    },
+    # --map-compact (N=1 rebuilds the Map solver as soon as there is a
+    # blocking clause, and again whenever they double in number)
+    {
+      'name':    'marco_py',
+      'files':   reg_files,
+      'flags':   ['--map-compact 1', '--map-compact 1 -b MCSes', '--map-compact 2 --nomax'],
+      'flags_all': common_flags,
+      'exclude': ['dlx2_aa.cnf'],
+      'default': True,
+    },
+    # --collapse-duplicates
+    {
+      'name':    'marco_py',
+      'files':   reg_files,
+      'flags':   ['--collapse-duplicates', '--collapse-duplicates -b MCSes', '--collapse-duplicates --parallel MUS,MCSonly'],
+      'flags_all': common_flags,
+      'exclude': ['dlx2_aa.cnf'],
+      'default': True,
+    },
+    # --prepass
+    {
+      'name':    'marco_py',
+      'files':   reg_files,
+      'flags':   ['--prepass', '--prepass -b MCSes', '--prepass --improved-implies', '--prepass --parallel MUS,MCS', '--prepass --parallel MUS,MCSonly'],
+      'flags_all': common_flags,
+      'exclude': ['dlx2_aa.cnf'],
+      'default': True,
+    },
+    # --result-bus
+    {
+      'name':    'marco_py',
+      'files':   reg_files,
+      'flags':   ['--parallel MUS,MCS --result-bus 1', '--parallel MUS,MUS,MCSonly --result-bus 1', '--parallel MUS,MUS --result-bus 1 --comms-ignore'],
+      'flags_all': common_flags,
+      'exclude': ['dlx2_aa.cnf'],
+      'default': True,
+    },
+    # --adaptive
+    {
+      'name':    'marco_py',
+      'files':   reg_files,
+      'flags':   ['--parallel MUS,MCS --adaptive 0.01', '--parallel MUS,MUS,MCSonly --adaptive 0.01', '--parallel MCS,MCS --adaptive 0.01'],
+      'flags_all': common_flags,
+      'exclude': ['dlx2_aa.cnf'],
+      'default': True,
+    },
+    # --listen (with local children only; remote workers are run separately)
+    {
+      'name':    'marco_py',
+      'files':   reg_files,
+      'flags':   ['--parallel MUS,MCS --listen 127.0.0.1:0 --authkey test', '--parallel MUS,MCSonly --listen 127.0.0.1:0 --authkey test --collapse-duplicates'],
+      'flags_all': common_flags,
+      'exclude': ['dlx2_aa.cnf'],
+      'default': True,
+    },
+    # --cache-dir, cold and then warm (see multirun.py)
+    {
+      'name':    'marco_py',
+      'cmd_array': [interpreter, 'multirun.py', 'cache'],
+      'files':   cnf_files,
+      'flags':   ['', '--parallel MUS,MCS'],
+      'flags_all': common_flags,
+      'exclude': ['dlx2_aa.cnf'],
+      'default': True,
+    },
+    # input from STDIN
+    {
+      'name':    'marco_py',
+      'cmd_array': [interpreter, 'multirun.py', 'stdin'],
+      'files':   cnf_files,
+      'flags':   ['', '--parallel MUS,MCS'],
+      'flags_all': common_flags,
+      'exclude': ['dlx2_aa.cnf'],
+      'default': True,
+    },
+    # bzip2-compressed input (xz below, if available)
+    {
+      'name':    'marco_py',
+      'cmd_array': [interpreter, 'multirun.py', 'compressed', 'bz2'],
+      'files':   cnf_files,
+      'flags':   [''],
+      'flags_all': common_flags,
+      'exclude': ['dlx2_aa.cnf'],
+      'default': True,
+    },
+    # --listen / --connect: a coordinator with remote workers in the given
+    # parallel modes (see multirun.py)
+    {
+      'name':    'marco_py',
+      'cmd_array': [interpreter, 'multirun.py', 'distributed', 'MUS,MCS'],
+      'files':   reg_files,
+      'flags':   ['', '--collapse-duplicates', '--prepass'],
+      'flags_all': common_flags,
+      'exclude': ['dlx2_aa.cnf'],
+      'default': True,
+    },
+    {
+      'name':    'marco_py',
+      'cmd_array': [interpreter, 'multirun.py', 'distributed', 'MUS,MUS,MCSonly'],
+      'files':   reg_files,
+      'flags':   [''],
+      'flags_all': common_flags,
+      'exclude': ['dlx2_aa.cnf'],
+      'default': True,
+    },
+    # --checkpoint / --resume: stopped by -l, then resumed (see multirun.py)
+    {
+      'name':    'marco_py',
+      'cmd_array': [interpreter, 'multirun.py', 'resume', '3'],
+      'files':   reg_files,
+      'flags':   ['', '-b MCSes', '--parallel MUS,MCS', '--collapse-duplicates'],
+      'flags_all': common_flags,
+      'exclude': ['dlx2_aa.cnf'],
+      'default': True,
+    },
 ]
+if lzma_available:
+    jobs.append(
+        # xz-compressed input
+        {
+        'name':    'marco_py',
+        'cmd_array': [interpreter, 'multirun.py', 'compressed', 'xz'],
+        'files':   cnf_files,
+        'flags':   [''],
+        'flags_all': common_flags,
+        'exclude': ['dlx2_aa.cnf'],
+        'default': True,
+        }
+    )
 if muser_available:
     jobs.extend([
         # --pmuser
@@ -1,5 +1,7 @@
 """Utility class(es) for marco_py"""
-from collections import Counter, defaultdict
+from collections import Counter, OrderedDict, defaultdict
+import array
+import itertools
 import os
 import subprocess
 import threading
@@ -19,38 +21,382 @@ _get_time = time.time   # wall-time
 
 
 def synchronize_class(sync_class):
-    """Make any class [somewhat] thread-safe by acquiring an
-    object-wide lock on every method call.  Note: this will
-    *not* protect access to non-method attributes.
+    """Make a [somewhat] thread-safe subclass of any class, in which every
+    method call acquires a lock held by the object (so separate objects
+    never contend for a lock).  Methods marked with @unsynchronized are
+    left as they are.  Note: this will *not* protect access to non-method
+    attributes.
 
     Based on: http://theorangeduck.com/page/synchronized-python
     """
-    lock = threading.RLock()
-
     def decorator(func):
-        def wrapper(*args, **kwargs):
-            with lock:
-                return func(*args, **kwargs)
+        def wrapper(self, *args, **kwargs):
+            with self.__lock__:
+                return func(self, *args, **kwargs)
         return wrapper
 
-    orig_init = sync_class.__init__
-
     def __init__(self, *args, **kwargs):
-        self.__lock__ = lock          # not used by this code, but could be useful
+        self.__lock__ = threading.RLock()
         self.__synchronized__ = True  # a flag to check in assertions
-        orig_init(self, *args, **kwargs)
-
-    sync_class.__init__ = __init__
+        sync_class.__init__(self, *args, **kwargs)
 
+    attrs = {'__init__': __init__}
     for key in dir(sync_class):
         val = getattr(sync_class, key)
         # synchronize all methods except __init__ (no other thread
         # can have a reference to an object before __init__ complete,
         # as far as I know)
-        if isinstance(val, (types.MethodType, types.FunctionType)) and key != '__init__':
-            setattr(sync_class, key, decorator(val))
+        if isinstance(val, (types.MethodType, types.FunctionType)) and key != '__init__' \
+                and not getattr(val, '__unsynchronized__', False):
+            attrs[key] = decorator(val)
+
+    # (created with sync_class's own metaclass, e.g., ABCMeta)
+    return type(sync_class)('Synchronized' + sync_class.__name__, (sync_class,), attrs)
+
+
+def unsynchronized(func):
+    """Mark a method as safe to call from any thread without the object's
+    lock, so that synchronize_class() leaves it unwrapped."""
+    func.__unsynchronized__ = True
+    return func
+
+
+class BitSet(object):
+    """A set of constraint indexes from 1 to n, stored as one byte per index
+    (a bytearray indexed from 1).  Membership is a single lookup, and
+    complement() is one pass over the bytes, with no per-element Python
+    objects, so it stays cheap for very large n.  Iteration yields indexes
+    in increasing order.  Adding an index outside 1..n raises ValueError
+    (a negative one would otherwise count from the end of the bytes).
+
+    >>> s = BitSet(6, [1, 4, 5])
+    >>> 4 in s, 2 in s, len(s)
+    (True, False, 3)
+    >>> list(s.complement())
+    [2, 3, 6]
+    >>> s.complement().difference([3])
+    BitSet(6, [2, 6])
+    >>> s.to_array(offset=-1)
+    array('i', [0, 3, 4])
+    >>> BitSet(6, [0])
+    Traceback (most recent call last):
+    ...
+    ValueError: index 0 out of range 1..6
+    """
+    __slots__ = ('n', 'bits')
+
+    _FLIP = bytes(bytearray([1, 0] + list(range(2, 256))))   # for translate()
+
+    def __init__(self, n, items=()):
+        self.n = n
+        self.bits = bytearray(n+1)
+        bits = self.bits
+        for i in items:
+            if not 0 < i <= n:
+                raise ValueError("index %d out of range 1..%d" % (i, n))
+            bits[i] = 1
+
+    def __contains__(self, i):
+        return 0 < i <= self.n and self.bits[i] == 1
+
+    def __iter__(self):
+        return itertools.compress(range(self.n+1), self.bits)
+
+    def __len__(self):
+        return self.bits.count(b'\x01')
+
+    def __repr__(self):
+        return "BitSet(%d, %s)" % (self.n, list(self))
+
+    def add(self, i):
+        if not 0 < i <= self.n:
+            raise ValueError("index %d out of range 1..%d" % (i, self.n))
+        self.bits[i] = 1
+
+    def discard(self, i):
+        if 0 < i <= self.n:
+            self.bits[i] = 0
+
+    def copy(self):
+        result = BitSet(0)
+        result.n = self.n
+        result.bits = bytearray(self.bits)
+        return result
+
+    def complement(self):
+        """Get the set of indexes from 1 to n not in this set."""
+        result = BitSet(0)
+        result.n = self.n
+        result.bits = self.bits.translate(self._FLIP)
+        result.bits[0] = 0
+        return result
+
+    def difference(self, items):
+        result = self.copy()
+        for i in items:
+            result.discard(i)
+        return result
+
+    def to_array(self, offset=0):
+        """Get the indexes (each plus offset) as an int array, e.g., to pass
+        as literals to a solver."""
+        if offset == 0:
+            return array.array('i', self)
+        return array.array('i', [i+offset for i in self])
+
+
+class SetTrie(object):
+    """An index of sets of integers (e.g., clauses), stored as a trie of
+    their sorted elements, that can quickly tell whether any stored set is
+    a subset (or superset) of a given set.
+
+    >>> t = SetTrie()
+    >>> t.add([3, 1])
+    >>> t.add([2, 4, 5])
+    >>> t.has_subset([1, 2, 3]), t.has_subset([2, 4]), t.has_subset([1, 2, 4, 5])
+    (True, False, True)
+    >>> t.contains([1, 3]), t.contains([1]), len(t)
+    (True, False, 2)
+    >>> sorted(t)
+    [[1, 3], [2, 4, 5]]
+    >>> t.count_supersets([4]), t.count_supersets([]), t.count_supersets([1, 2])
+    (1, 2, 0)
+    >>> list(t.subsets([1, 3, 4])), list(t.supersets([2, 5]))
+    ([[1, 3]], [[2, 4, 5]])
+    >>> t.remove([1, 3])
+    >>> sorted(t), len(t)
+    ([[2, 4, 5]], 1)
+    """
+    _END = None   # key marking the end of a stored set
 
-    return sync_class
+    def __init__(self):
+        self._root = {}
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        """Iterate over the stored sets (each as a sorted list)."""
+        stack = [(self._root, [])]
+        while stack:
+            node, path = stack.pop()
+            for x, child in node.items():
+                if x is self._END:
+                    yield path
+                else:
+                    stack.append((child, path + [x]))
+
+    def add(self, items):
+        node = self._root
+        for x in sorted(items):
+            node = node.setdefault(x, {})
+        if self._END not in node:
+            node[self._END] = True
+            self._size += 1
+
+    def contains(self, items):
+        node = self._root
+        for x in sorted(items):
+            node = node.get(x)
+            if node is None:
+                return False
+        return self._END in node
+
+    def has_subset(self, items):
+        """Check whether any stored set is a subset of (or equal to) items."""
+        if not isinstance(items, (set, frozenset, BitSet)):
+            items = set(items)
+        return self.has_subset_where(items.__contains__)
+
+    def has_subset_where(self, member):
+        """Check whether any stored set has only elements x for which
+        member(x) is true."""
+        # every path in the trie is increasing, so a stored set is a subset
+        # iff each element along its path is a member
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if self._END in node:
+                return True
+            for x, child in node.items():
+                if x is not self._END and member(x):
+                    stack.append(child)
+        return False
+
+    def subsets(self, items):
+        """Iterate over the stored sets (each as a sorted list) that are
+        subsets of (or equal to) items."""
+        if not isinstance(items, (set, frozenset, BitSet)):
+            items = set(items)
+        stack = [(self._root, [])]
+        while stack:
+            node, path = stack.pop()
+            for x, child in node.items():
+                if x is self._END:
+                    yield path
+                elif x in items:
+                    stack.append((child, path + [x]))
+
+    def supersets(self, items):
+        """Iterate over the stored sets (each as a sorted list) that are
+        supersets of (or equal to) items."""
+        items = sorted(items)
+        # (node, path to it, number of items matched along the path); a
+        # path passing an unmatched item can no longer contain it
+        stack = [(self._root, [], 0)]
+        while stack:
+            node, path, i = stack.pop()
+            for x, child in node.items():
+                if x is self._END:
+                    if i == len(items):
+                        yield path
+                elif i == len(items) or x < items[i]:
+                    stack.append((child, path + [x], i))
+                elif x == items[i]:
+                    stack.append((child, path + [x], i + 1))
+
+    def count_supersets(self, items):
+        """Count the stored sets that are supersets of (or equal to) items."""
+        return sum(1 for _ in self.supersets(items))
+
+    def remove(self, items):
+        """Remove a stored set (which must be present)."""
+        path = [self._root]
+        for x in sorted(items):
+            path.append(path[-1][x])
+        del path[-1][self._END]
+        self._size -= 1
+        # prune the nodes left without any set below them
+        for parent, x in zip(reversed(path[:-1]), reversed(sorted(items))):
+            if parent[x]:
+                break
+            del parent[x]
+
+
+class LatticeCache(object):
+    """A bounded cache of known satisfiable and unsatisfiable subsets of the
+    constraints, used to answer subset checks without calling a solver:
+    any superset of a known unsatisfiable subset (e.g., an unsat core) is
+    unsatisfiable, and any subset of a known satisfiable subset is
+    satisfiable.  Each kind holds at most maxsize entries, evicting the
+    least recently used.
+
+    Rather than testing every entry, unsatisfiable subsets are indexed in a
+    SetTrie (a lookup follows only paths within the checked subset), and
+    satisfiable subsets by constraint: each constraint has a bitmask (a
+    Python int) of the entries containing it, so the entries containing a
+    checked subset are the AND of its constraints' masks.
+
+    >>> c = LatticeCache(maxsize=2)
+    >>> def solve(subset):    # the constraint set {1, 3} is the only MUS
+    ...     if 1 in subset and 3 in subset:
+    ...         return False, [1, 3]
+    ...     return True, [x for x in (1, 2, 4) if x in subset or x != 1]
+    >>> c.check([1, 2, 3], solve)
+    (False, [1, 3], False)
+    >>> c.check([1, 3, 4], solve)
+    (False, [1, 3], True)
+    >>> c.check([2], solve)
+    (True, [2, 4], False)
+    >>> c.check([4], solve)
+    (True, [2, 4], True)
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        # unsatisfiable subsets: sorted subset -> subset as given, in least
+        # to most recently used order, and indexed in a trie
+        self._unsat = OrderedDict()
+        self._unsat_index = SetTrie()
+        # satisfiable subsets: slot -> subset as given, in least to most
+        # recently used order; bit i of a mask stands for slot i
+        self._sat = OrderedDict()
+        self._sat_masks = {}    # constraint -> mask of the entries containing it
+        self._sat_live = 0      # mask of the slots in use
+        self._free_slots = []
+
+    def lookup(self, subset):
+        """Get (is_sat, known subset) for the given subset (a set), or None
+        if it is not decided by the cache."""
+        for path in self._unsat_index.subsets(subset):
+            key = tuple(path)
+            known = self._unsat.pop(key)
+            self._unsat[key] = known   # most recently used
+            return False, known
+        found = self._sat_live
+        for i in subset:
+            found &= self._sat_masks.get(i, 0)
+            if not found:
+                return None
+        if found:
+            slot = (found & -found).bit_length() - 1   # (the lowest)
+            known = self._sat.pop(slot)
+            self._sat[slot] = known
+            return True, known
+        return None
+
+    def add(self, is_sat, subset):
+        if is_sat:
+            self._add_sat(subset)
+        else:
+            # drop anything the new subset covers
+            for path in list(self._unsat_index.supersets(subset)):
+                self._unsat_index.remove(path)
+                del self._unsat[tuple(path)]
+            key = tuple(sorted(subset))
+            self._unsat[key] = tuple(subset)
+            self._unsat_index.add(key)
+            while len(self._unsat) > self.maxsize:
+                key, _ = self._unsat.popitem(last=False)
+                self._unsat_index.remove(key)
+
+    def _add_sat(self, subset):
+        # drop anything the new subset covers: entries with no constraint
+        # outside of it
+        members = set(subset)
+        covered = self._sat_live
+        for i, mask in self._sat_masks.items():
+            if i not in members:
+                covered &= ~mask
+        while covered:
+            slot = (covered & -covered).bit_length() - 1
+            self._remove_sat(slot)
+            covered &= covered - 1
+
+        slot = self._free_slots.pop() if self._free_slots else len(self._sat)
+        bit = 1 << slot
+        self._sat[slot] = tuple(subset)
+        self._sat_live |= bit
+        for i in members:
+            self._sat_masks[i] = self._sat_masks.get(i, 0) | bit
+        while len(self._sat) > self.maxsize:
+            self._remove_sat(next(iter(self._sat)))
+
+    def _remove_sat(self, slot):
+        bit = 1 << slot
+        for i in self._sat.pop(slot):
+            mask = self._sat_masks[i] & ~bit
+            if mask:
+                self._sat_masks[i] = mask
+            else:
+                del self._sat_masks[i]
+        self._sat_live &= ~bit
+        self._free_slots.append(slot)
+
+    def check(self, subset, solve):
+        """Check a subset, from the cache if possible, otherwise with
+        solve(subset) (returning is_sat and either a satisfiable superset or
+        an unsatisfiable subset of subset, which is then cached).
+
+        Returns:
+            A tuple (is_sat, improved subset, cache hit?).
+        """
+        known = self.lookup(set(subset))
+        if known is not None:
+            return known[0], list(known[1]), True
+        is_sat, improved = solve(subset)
+        self.add(is_sat, improved)
+        return is_sat, improved, False
 
 
 class ExecutableException(Exception):
@@ -106,6 +452,11 @@ class Statistics(object):
     >>> s.get_counts()
     Counter({'outer': 2, 'inner': 1, 'countA': 2, 'countB': 1})
 
+    A counter can also be increased by more than one at a time.
+    >>> s.increment_counter('countB', 3)
+    >>> s.get_counts()['countB']
+    4
+
     The object also provides a method for collecting arbitrary statistics.
     Every value added for a given string is appended to a list.
     >>> s.add_stat('statA', 5)
@@ -137,8 +488,8 @@ class Statistics(object):
             self._stats.end_time(self._category)
             return False  # doesn't handle any exceptions itself
 
-    def increment_counter(self, category):
-        self._counts[category] += 1
+    def increment_counter(self, category, amount=1):
+        self._counts[category] += amount
 
     def start_time(self, category):
         assert category not in self._active_timers